@@ -1,23 +1,67 @@
+import asyncio
 import json
 import uuid
 import os
-from datetime import datetime
-from typing import Dict, Optional, List, Any
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from itertools import islice
+from functools import lru_cache
+from typing import Dict, Optional, List, Any, Tuple
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import RedirectResponse
 from pydantic import BaseModel
+from cachetools import LRUCache, TTLCache
+import dspy
 os.environ['OAUTHLIB_INSECURE_TRANSPORT'] = '1'
 
 from api.app.websocket_handler import AnalysisWebSocketHandler
+from api.app.store import ConversationStore, HistoryMessage, iso_from_ns
 import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
-from gmail import GmailService
+from gmail import GmailService, SCOPES as GMAIL_SCOPES
+from external_tools import sql_tool
 from google_auth_oauthlib.flow import Flow
+from requests.adapters import HTTPAdapter
 from google.oauth2.credentials import Credentials
 
-app = FastAPI(title="AI Data Search API", version="1.0.0")
+CONVERSATION_DB = os.getenv("CONVERSATION_DB", "conversations.db")
+CONVERSATION_CACHE_SIZE = int(os.getenv("CONVERSATION_CACHE_SIZE", "512"))
+HISTORY_MAX = int(os.getenv("HISTORY_MAX", "500"))  # Messages kept in memory per conversation
+SESSION_SWEEP_INTERVAL = 60  # seconds
+HANDLER_RETAIN_SECONDS = 60  # How long a disconnected conversation's handler waits for a reconnect
+
+
+async def _sweep_user_sessions():
+    """TTLCache only evicts on access, so expire OAuth flows actively"""
+    while True:
+        await asyncio.sleep(SESSION_SWEEP_INTERVAL)
+        user_sessions.expire()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    store = ConversationStore(CONVERSATION_DB)
+    await store.open()
+    app.state.store = store
+    manager.store = store
+    # One LM (and so one HTTP connection pool) shared by every conversation
+    app.state.lm = dspy.LM('anthropic/claude-sonnet-4-20250514', api_key=os.getenv('ANTHROPIC_API_KEY'))
+    # One Postgres pool for every conversation's SQL tool; tools create their own if unset
+    app.state.pg_pool = await sql_tool.create_pool() if os.getenv("PG_HOST") else None
+    sweeper = asyncio.create_task(_sweep_user_sessions())
+    try:
+        yield
+    finally:
+        sweeper.cancel()
+        if app.state.pg_pool is not None:
+            await app.state.pg_pool.close()
+        await store.close()
+
+
+app = FastAPI(title="AI Data Search API", version="1.0.0", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -45,117 +89,187 @@ class GmailStatusResponse(BaseModel):
     user_email: str = None
     error: str = None
 
+def _now() -> Tuple[int, str]:
+    """Current time as (nanoseconds since epoch, ISO string) from a single clock read"""
+    now_ns = time.time_ns()
+    return now_ns, iso_from_ns(now_ns)
+
+
 class ConnectionManager:
-    def __init__(self):
+    def __init__(self, store: Optional[ConversationStore] = None):
+        self.store = store  # Authoritative, shared across workers; attached in lifespan
         self.active_connections: Dict[str, WebSocket] = {}
         self.handlers: Dict[str, AnalysisWebSocketHandler] = {}
-        self.conversations: Dict[str, dict] = {}
-        self.workflow_states: Dict[str, Any] = {}  # Store workflow instances
+        self.conversations: LRUCache = LRUCache(maxsize=CONVERSATION_CACHE_SIZE)  # Hot set of loaded conversations
+        self.workflow_states: Dict[str, Any] = {}  # Store workflow instances (not persistable)
+        self._expiries: Dict[str, asyncio.TimerHandle] = {}  # Pending handler drops after disconnect
 
     async def initialize_conversation(self, conversation_id: str):
         """Initialize a new conversation with default settings"""
-        self.conversations[conversation_id] = {
+        created_ns, created_at = _now()
+        conversation = {
             "id": conversation_id,
-            "created_at": datetime.now().isoformat(),
+            "created_at": created_at,
+            "last_activity_ns": created_ns,
+            "message_count": 0,
             "status": "initialized",
             "metadata": {},
-            "history": [],  # Store conversation history
+            "history": deque(maxlen=HISTORY_MAX),  # Most recent messages; the store keeps everything
             "workflow_state": None  # Will store serialized workflow state
         }
+        self.conversations[conversation_id] = conversation
+        await self.store.put(conversation)
 
-    async def connect(self, websocket: WebSocket, conversation_id: str):
+    async def connect(self, websocket: WebSocket, conversation_id: str, lm: Any = None, pg_pool: Any = None):
         await websocket.accept()
-        handler = AnalysisWebSocketHandler(websocket, conversation_id, self)
+        expiry = self._expiries.pop(conversation_id, None)
+        if expiry is not None:
+            expiry.cancel()
+        handler = self.handlers.get(conversation_id)
+        # Only a handler waiting to expire is free; while another socket for this
+        # conversation is connected (a second tab) that one keeps its own handler
+        if handler is not None and expiry is not None and conversation_id not in self.active_connections:
+            # Reconnect: keep the handler (and its workflow) and point it at the new socket
+            handler.rebind(websocket)
+        else:
+            handler = AnalysisWebSocketHandler(websocket, conversation_id, self, lm=lm, pg_pool=pg_pool)
+            self.handlers[conversation_id] = handler
         self.active_connections[conversation_id] = websocket
-        self.handlers[conversation_id] = handler
         return handler
 
-    def disconnect(self, conversation_id: str):
+    def disconnect(self, conversation_id: str, websocket: Optional[WebSocket] = None):
+        # A newer connection for this conversation has already taken over
+        if websocket is not None and self.active_connections.get(conversation_id) is not websocket:
+            return
         self.active_connections.pop(conversation_id, None)
+        # Keep the handler and workflow around briefly so a reconnecting client picks them up
+        self._expiries[conversation_id] = asyncio.get_running_loop().call_later(
+            HANDLER_RETAIN_SECONDS, self._drop_handler, conversation_id
+        )
+
+    def _drop_handler(self, conversation_id: str):
+        self._expiries.pop(conversation_id, None)
         self.handlers.pop(conversation_id, None)
+        # Workflow instances only live as long as their handler
+        self.workflow_states.pop(conversation_id, None)
 
     def get_handler(self, conversation_id: str) -> AnalysisWebSocketHandler:
         return self.handlers.get(conversation_id)
 
-    def conversation_exists(self, conversation_id: str) -> bool:
-        return conversation_id in self.conversations
+    async def _load_conversation(self, conversation_id: str) -> Optional[dict]:
+        """Read a conversation through the hot cache, falling back to the store
+
+        Other workers write to the same store, so a cached copy is only used
+        while its revision (activity stamp, message count, updated_at) still
+        matches the stored row.
+        """
+        conversation = self.conversations.get(conversation_id)
+        if conversation is not None:
+            stored = await self.store.revision(conversation_id)
+            cached = (conversation["last_activity_ns"], conversation["message_count"], conversation.get("updated_at"))
+            if stored != cached:
+                self.conversations.pop(conversation_id, None)
+                conversation = None
+        if conversation is None:
+            conversation = await self.store.get(conversation_id, history_limit=HISTORY_MAX)
+            if conversation is not None:
+                conversation["history"] = deque(conversation["history"], maxlen=HISTORY_MAX)
+                self.conversations[conversation_id] = conversation
+        return conversation
+
+    async def conversation_exists(self, conversation_id: str) -> bool:
+        return await self._load_conversation(conversation_id) is not None
     
-    def add_message_to_history(self, conversation_id: str, message_type: str, content: Any, is_user: bool = False):
+    async def add_message_to_history(self, conversation_id: str, message_type: str, content: Any, is_user: bool = False):
         """Add a message to conversation history"""
-        if conversation_id in self.conversations:
-            message = {
-                "id": str(uuid.uuid4()),
-                "type": message_type,
-                "content": content,
-                "is_user": is_user,
-                "timestamp": datetime.now().isoformat()
-            }
-            self.conversations[conversation_id]["history"].append(message)
+        conversation = await self._load_conversation(conversation_id)
+        if conversation is not None:
+            now_ns = time.time_ns()
+            message = HistoryMessage.create(str(uuid.uuid4()), message_type, content, is_user, now_ns)
+            await self.store.append_messages(conversation_id, [message])
+            # Mirror what the store now holds so the cached copy stays current
+            conversation["history"].append(message)
+            conversation["last_activity_ns"] = now_ns
+            conversation["message_count"] += 1
+
+    async def add_messages_to_history_bulk(self, conversation_id: str, message_type: str, items: List[Tuple[Any, bytes]], is_user: bool = False):
+        """Add several messages at once; each item is (content, content already encoded as JSON)"""
+        conversation = await self._load_conversation(conversation_id)
+        if conversation is not None and items:
+            now_ns = time.time_ns()
+            messages = [
+                HistoryMessage.create(str(uuid.uuid4()), message_type, content, is_user, now_ns)
+                for content, _ in items
+            ]
+            await self.store.append_messages(conversation_id, messages, [payload for _, payload in items])
+            conversation["history"].extend(messages)
+            conversation["last_activity_ns"] = now_ns
+            conversation["message_count"] += len(messages)
     
-    def get_conversation_history(self, conversation_id: str) -> List[dict]:
-        """Get conversation history"""
-        if conversation_id in self.conversations:
-            return self.conversations[conversation_id]["history"]
+    async def get_conversation_history(self, conversation_id: str, offset: int = 0, limit: Optional[int] = None) -> List[dict]:
+        """Get a page of the conversation's history, counted from its first message"""
+        conversation = await self._load_conversation(conversation_id)
+        if conversation is not None:
+            history = conversation["history"]
+            # The deque holds only the latest messages; older pages come from the store
+            start = conversation["message_count"] - len(history)
+            if offset < start:
+                messages = await self.store.history(conversation_id, offset, limit)
+            else:
+                stop = None if limit is None else offset - start + limit
+                messages = islice(history, offset - start, stop)
+            return [message.to_dict() for message in messages]
         return []
     
-    def store_workflow_state(self, conversation_id: str, workflow_instance: Any):
+    async def store_workflow_state(self, conversation_id: str, workflow_instance: Any):
         """Store workflow state for later retrieval"""
-        if conversation_id in self.conversations:
+        conversation = await self._load_conversation(conversation_id)
+        if conversation is not None:
             self.workflow_states[conversation_id] = workflow_instance
             # Also store basic state info in conversation
-            self.conversations[conversation_id]["workflow_state"] = {
+            workflow_state = {
                 "user_id": workflow_instance.user_id,
                 "conversation_id": workflow_instance.conversation_id,
                 "current_branch": workflow_instance.current_branch,
                 "branches_count": len(workflow_instance.branches),
                 "tools_count": len(workflow_instance.tools_registry)
             }
+            updated_at = _now()[1]
+            await self.store.update_workflow_state(conversation_id, workflow_state, updated_at)
+            conversation["workflow_state"] = workflow_state
+            conversation["updated_at"] = updated_at
     
     def get_workflow_state(self, conversation_id: str) -> Any:
         """Get stored workflow state"""
         return self.workflow_states.get(conversation_id)
     
-    def update_conversation_status(self, conversation_id: str, status: str):
+    async def update_conversation_status(self, conversation_id: str, status: str):
         """Update conversation status"""
-        if conversation_id in self.conversations:
-            self.conversations[conversation_id]["status"] = status
-            self.conversations[conversation_id]["updated_at"] = datetime.now().isoformat()
+        conversation = await self._load_conversation(conversation_id)
+        if conversation is not None:
+            now_ns, updated_at = _now()
+            await self.store.update_status(conversation_id, status, updated_at, now_ns)
+            conversation["status"] = status
+            conversation["updated_at"] = updated_at
+            conversation["last_activity_ns"] = max(conversation["last_activity_ns"], now_ns)
     
-    def get_conversation_info(self, conversation_id: str) -> Optional[dict]:
+    async def get_conversation_info(self, conversation_id: str) -> Optional[dict]:
         """Get full conversation information"""
-        return self.conversations.get(conversation_id)
+        conversation = await self._load_conversation(conversation_id)
+        if conversation is not None:
+            history = conversation["history"]
+            if len(history) < conversation["message_count"]:
+                # Longer than the in-memory window; the store has every message
+                history = await self.store.history(conversation_id)
+            return {**conversation, "history": [message.to_dict() for message in history]}
+        return None
     
-    def get_all_conversations(self) -> List[dict]:
-        """Get list of all conversations with summary info"""
-        conversations = []
-        for conv_id, conv_data in self.conversations.items():
-            # Find first user message for title generation
-            first_message = None
-            message_count = len(conv_data.get("history", []))
-            last_activity = None
-            
-            for msg in conv_data.get("history", []):
-                if msg.get("is_user") and msg.get("type") == "user_message":
-                    first_message = msg.get("content", "")
-                    break
-            
-            # Get last activity timestamp
-            if conv_data.get("history"):
-                last_activity = conv_data["history"][-1].get("timestamp")
-            
-            conversation_summary = {
-                "id": conv_id,
-                "created_at": conv_data.get("created_at"),
-                "first_message": first_message or "New conversation",
-                "status": conv_data.get("status", "initialized"),
-                "message_count": message_count,
-                "last_activity": last_activity or conv_data.get("updated_at") or conv_data.get("created_at")
-            }
-            conversations.append(conversation_summary)
-        
-        # Sort by last activity (most recent first)
-        conversations.sort(key=lambda x: x.get("last_activity", ""), reverse=True)
-        return conversations
+    async def get_all_conversations(self) -> List[dict]:
+        """Get list of all conversations with summary info, most recent first"""
+        summaries = await self.store.list_summaries()
+        for summary in summaries:
+            summary["first_message"] = summary["first_message"] or "New conversation"
+        return summaries
 
 
 manager = ConnectionManager()
@@ -163,7 +277,29 @@ manager = ConnectionManager()
 # Gmail service and OAuth configuration
 gmail_service = GmailService()
 GMAIL_REDIRECT_URI = "http://localhost:8000/auth/callback"
-user_sessions = {}  # Store user credentials temporarily
+# Pending OAuth flows by state; abandoned ones expire with Google's authorization code
+user_sessions = TTLCache(maxsize=1024, ttl=600)
+# Absorbs frontend polling of /api/gmail/status without hitting Gmail each time
+gmail_status_cache = TTLCache(maxsize=1, ttl=30)
+# Shared by every OAuth flow so token exchanges reuse keep-alive connections to Google
+_oauth_adapter = HTTPAdapter()
+
+
+@lru_cache(maxsize=1)
+def _gmail_client_config() -> dict:
+    """Parse credentials.json once; it doesn't change while the server runs"""
+    with open("credentials.json") as f:
+        return json.load(f)
+
+
+def _new_gmail_flow() -> Flow:
+    flow = Flow.from_client_config(
+        _gmail_client_config(),
+        scopes=GMAIL_SCOPES,
+        redirect_uri=GMAIL_REDIRECT_URI
+    )
+    flow.oauth2session.mount("https://", _oauth_adapter)
+    return flow
 
 
 @app.get("/")
@@ -191,10 +327,10 @@ async def create_new_conversation():
 async def get_conversation(conversation_id: str):
     """Get conversation information and history"""
     try:
-        if not manager.conversation_exists(conversation_id):
+        if not await manager.conversation_exists(conversation_id):
             raise HTTPException(status_code=404, detail="Conversation not found")
         
-        conversation_info = manager.get_conversation_info(conversation_id)
+        conversation_info = await manager.get_conversation_info(conversation_id)
         return {
             "success": True,
             "conversation": conversation_info
@@ -205,13 +341,13 @@ async def get_conversation(conversation_id: str):
         raise HTTPException(status_code=500, detail=f"Failed to get conversation: {str(e)}")
 
 @app.get("/api/conversation/{conversation_id}/history")
-async def get_conversation_history(conversation_id: str):
-    """Get conversation history"""
+async def get_conversation_history(conversation_id: str, offset: int = 0, limit: Optional[int] = None):
+    """Get conversation history, optionally paginated"""
     try:
-        if not manager.conversation_exists(conversation_id):
+        if not await manager.conversation_exists(conversation_id):
             raise HTTPException(status_code=404, detail="Conversation not found")
         
-        history = manager.get_conversation_history(conversation_id)
+        history = await manager.get_conversation_history(conversation_id, offset, limit)
         return {
             "success": True,
             "history": history,
@@ -226,7 +362,7 @@ async def get_conversation_history(conversation_id: str):
 async def get_all_conversations():
     """Get list of all conversations with summary info"""
     try:
-        conversations = manager.get_all_conversations()
+        conversations = await manager.get_all_conversations()
         return {
             "success": True,
             "conversations": conversations,
@@ -240,11 +376,7 @@ async def get_all_conversations():
 async def gmail_auth():
     """Start Gmail OAuth flow"""
     try:
-        flow = Flow.from_client_secrets_file(
-            "credentials.json",
-            scopes=["https://www.googleapis.com/auth/gmail.compose"],
-            redirect_uri=GMAIL_REDIRECT_URI
-        )
+        flow = _new_gmail_flow()
         
         auth_url, state = flow.authorization_url(
             access_type='offline',
@@ -280,15 +412,17 @@ async def gmail_callback(request: Request):
         # Get the flow from session
         flow = user_sessions[state]["flow"]
         
-        # Exchange authorization code for credentials
-        flow.fetch_token(authorization_response=authorization_response)
+        # Exchange authorization code for credentials (blocking HTTP call)
+        await asyncio.to_thread(flow.fetch_token, authorization_response=authorization_response)
         
         # Store credentials in session
         user_sessions[state]["credentials"] = flow.credentials
         
         # Initialize Gmail service with new credentials
         gmail_service.credentials = flow.credentials
-        gmail_service.service = None  # Will be rebuilt on next connection check
+        gmail_service.service = None
+        await asyncio.to_thread(gmail_service.ensure_service)
+        gmail_status_cache.clear()
         
         return RedirectResponse(url="http://localhost:3000")
         
@@ -308,21 +442,26 @@ async def gmail_status():
                 error="Not authenticated - call /api/gmail/auth first"
             )
         
+        cached = gmail_status_cache.get("status")
+        if cached is not None:
+            return cached
+
         # Build service if needed
         if not gmail_service.service:
-            from googleapiclient.discovery import build
-            gmail_service.service = build("gmail", "v1", credentials=gmail_service.credentials)
+            await asyncio.to_thread(gmail_service.ensure_service)
         
-        # Check connection
-        status = gmail_service.check_connection()
+        # Check connection without blocking the event loop
+        status = await asyncio.to_thread(gmail_service.check_connection)
         
-        return GmailStatusResponse(
+        response = GmailStatusResponse(
             connected=status["connected"],
             authenticated=status["authenticated"],
             service_available=status["service_available"],
             user_email=status["user_email"],
             error=status["error"]
         )
+        gmail_status_cache["status"] = response
+        return response
         
     except Exception as e:
         return GmailStatusResponse(
@@ -337,7 +476,7 @@ async def gmail_status():
 async def research_and_mail(request: dict):
     """Run research and mail tool with authenticated Gmail service"""
     try:
-        if not gmail_service.is_connected():
+        if not await asyncio.to_thread(gmail_service.is_connected):
             raise HTTPException(status_code=400, detail="Gmail not authenticated - call /api/gmail/auth first")
         
         # Import and create tool with authenticated service
@@ -368,14 +507,13 @@ async def research_and_mail(request: dict):
 
 @app.websocket("/ws/{conversation_id}")
 async def websocket_endpoint(websocket: WebSocket, conversation_id: str):
-    handler = await manager.connect(websocket, conversation_id)
+    state = websocket.app.state
+    handler = await manager.connect(websocket, conversation_id, state.lm, state.pg_pool)
     try:
         while True:
-            data = await websocket.receive_text()
-            message = json.loads(data)
-            await handler.handle_message(message)
+            await handler.handle_raw(await websocket.receive_text())
     except WebSocketDisconnect:
-        manager.disconnect(conversation_id)
+        manager.disconnect(conversation_id, websocket)
 
 
 if __name__ == "__main__":
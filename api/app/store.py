@@ -0,0 +1,269 @@
+import json
+import sys
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import aiosqlite
+import orjson
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS conversations (
+    id TEXT PRIMARY KEY,
+    created_at TEXT NOT NULL,
+    updated_at TEXT,
+    status TEXT NOT NULL,
+    metadata TEXT NOT NULL DEFAULT '{}',
+    workflow_state TEXT,
+    first_message TEXT,
+    message_count INTEGER NOT NULL DEFAULT 0,
+    last_activity TEXT NOT NULL,
+    last_activity_ns INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_conversations_last_activity_ns ON conversations (last_activity_ns);
+
+CREATE TABLE IF NOT EXISTS messages (
+    conversation_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    id TEXT NOT NULL,
+    type TEXT NOT NULL,
+    content_json TEXT NOT NULL,
+    is_user INTEGER NOT NULL,
+    ts TEXT NOT NULL,
+    PRIMARY KEY (conversation_id, seq)
+);
+"""
+
+
+def iso_from_ns(ts_ns: int) -> str:
+    """Local ISO timestamp for nanoseconds since epoch, exact to the microsecond"""
+    seconds, ns = divmod(ts_ns, 1_000_000_000)
+    return datetime.fromtimestamp(seconds).replace(microsecond=ns // 1000).isoformat()
+
+
+def ns_from_iso(timestamp: str) -> int:
+    moment = datetime.fromisoformat(timestamp)
+    return int(moment.replace(microsecond=0).timestamp()) * 1_000_000_000 + moment.microsecond * 1000
+
+
+@dataclass(slots=True)
+class HistoryMessage:
+    """One history entry; kept compact since long conversations hold hundreds of them"""
+    id: str
+    type: str  # Interned: only a handful of distinct message types exist
+    content: Any
+    is_user: bool
+    ts_ns: int
+
+    @classmethod
+    def create(cls, id: str, type: str, content: Any, is_user: bool, ts_ns: int) -> "HistoryMessage":
+        return cls(id, sys.intern(type), content, is_user, ts_ns)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "type": self.type,
+            "content": self.content,
+            "is_user": self.is_user,
+            "timestamp": iso_from_ns(self.ts_ns),
+        }
+
+
+def _history_message(row: aiosqlite.Row) -> HistoryMessage:
+    return HistoryMessage.create(
+        row["id"],
+        row["type"],
+        orjson.loads(row["content_json"]),
+        bool(row["is_user"]),
+        ns_from_iso(row["ts"]),
+    )
+
+
+class ConversationStore:
+    """SQLite-backed conversation persistence shared by every uvicorn worker"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._db: Optional[aiosqlite.Connection] = None
+
+    async def open(self):
+        self._db = await aiosqlite.connect(self.path)
+        self._db.row_factory = aiosqlite.Row
+        # WAL lets workers read while another one is writing
+        await self._db.execute("PRAGMA journal_mode=WAL")
+        await self._db.executescript(SCHEMA)
+        await self._db.commit()
+
+    async def close(self):
+        if self._db is not None:
+            await self._db.close()
+            self._db = None
+
+    async def put(self, conversation: Dict[str, Any]):
+        """Insert a conversation or update its mutable fields"""
+        last_activity = conversation.get("updated_at") or conversation["created_at"]
+        await self._db.execute(
+            """
+            INSERT INTO conversations (id, created_at, updated_at, status, metadata, workflow_state, last_activity, last_activity_ns)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(id) DO UPDATE SET
+                updated_at = excluded.updated_at,
+                status = excluded.status,
+                metadata = excluded.metadata,
+                workflow_state = excluded.workflow_state,
+                last_activity = CASE WHEN excluded.last_activity_ns > conversations.last_activity_ns
+                    THEN excluded.last_activity ELSE conversations.last_activity END,
+                last_activity_ns = MAX(conversations.last_activity_ns, excluded.last_activity_ns)
+            """,
+            (
+                conversation["id"],
+                conversation["created_at"],
+                conversation.get("updated_at"),
+                conversation["status"],
+                json.dumps(conversation.get("metadata") or {}),
+                json.dumps(conversation.get("workflow_state")),
+                last_activity,
+                conversation.get("last_activity_ns", 0),
+            ),
+        )
+        await self._db.commit()
+
+    async def get(self, conversation_id: str, history_limit: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """Load a conversation with its history (only the latest history_limit messages if given)"""
+        async with self._db.execute(
+            "SELECT * FROM conversations WHERE id = ?", (conversation_id,)
+        ) as cursor:
+            row = await cursor.fetchone()
+        if row is None:
+            return None
+
+        async with self._db.execute(
+            "SELECT id, type, content_json, is_user, ts FROM messages WHERE conversation_id = ? ORDER BY seq DESC LIMIT ?",
+            (conversation_id, -1 if history_limit is None else history_limit),
+        ) as cursor:
+            messages = await cursor.fetchall()
+        messages.reverse()
+
+        conversation = {
+            "id": row["id"],
+            "created_at": row["created_at"],
+            "status": row["status"],
+            "metadata": json.loads(row["metadata"]),
+            "history": [_history_message(message) for message in messages],
+            "workflow_state": json.loads(row["workflow_state"]) if row["workflow_state"] else None,
+            "last_activity_ns": row["last_activity_ns"],
+            "message_count": row["message_count"],
+        }
+        if row["updated_at"]:
+            conversation["updated_at"] = row["updated_at"]
+        return conversation
+
+    async def history(self, conversation_id: str, offset: int = 0, limit: Optional[int] = None) -> List[HistoryMessage]:
+        """A page of a conversation's history, oldest first, counted from its first message"""
+        async with self._db.execute(
+            "SELECT id, type, content_json, is_user, ts FROM messages WHERE conversation_id = ? ORDER BY seq LIMIT ? OFFSET ?",
+            (conversation_id, -1 if limit is None else limit, offset),
+        ) as cursor:
+            messages = await cursor.fetchall()
+        return [_history_message(message) for message in messages]
+
+    async def revision(self, conversation_id: str) -> Optional[Tuple[int, int, Optional[str]]]:
+        """(last_activity_ns, message_count, updated_at): changes with every write, so tells whether a cached copy is current"""
+        async with self._db.execute(
+            "SELECT last_activity_ns, message_count, updated_at FROM conversations WHERE id = ?", (conversation_id,)
+        ) as cursor:
+            row = await cursor.fetchone()
+        return None if row is None else (row["last_activity_ns"], row["message_count"], row["updated_at"])
+
+    async def update_status(self, conversation_id: str, status: str, updated_at: str, activity_ns: int):
+        """Set a conversation's status, leaving every other column as stored"""
+        await self._db.execute(
+            """
+            UPDATE conversations SET
+                status = ?,
+                updated_at = ?,
+                last_activity = CASE WHEN ? > last_activity_ns THEN ? ELSE last_activity END,
+                last_activity_ns = MAX(last_activity_ns, ?)
+            WHERE id = ?
+            """,
+            (status, updated_at, activity_ns, updated_at, activity_ns, conversation_id),
+        )
+        await self._db.commit()
+
+    async def update_workflow_state(self, conversation_id: str, workflow_state: Optional[Dict[str, Any]], updated_at: str):
+        """Set a conversation's workflow state, leaving every other column as stored"""
+        await self._db.execute(
+            "UPDATE conversations SET workflow_state = ?, updated_at = ? WHERE id = ?",
+            (json.dumps(workflow_state), updated_at, conversation_id),
+        )
+        await self._db.commit()
+
+    async def list_summaries(self) -> List[Dict[str, Any]]:
+        """Summaries of every conversation, most recent activity first"""
+        async with self._db.execute(
+            """
+            SELECT id, created_at, first_message, status, message_count, last_activity
+            FROM conversations
+            ORDER BY last_activity_ns DESC
+            """
+        ) as cursor:
+            rows = await cursor.fetchall()
+        return [dict(row) for row in rows]
+
+    async def append_messages(
+        self,
+        conversation_id: str,
+        messages: List[HistoryMessage],
+        encoded_contents: Optional[List[bytes]] = None,
+    ):
+        """Append history messages in one transaction and roll them into the summary
+
+        encoded_contents, when given, holds each message's content already
+        encoded as JSON and is stored as-is instead of re-encoding.
+        """
+        if not messages:
+            return
+        if encoded_contents is None:
+            encoded_contents = [orjson.dumps(message.content) for message in messages]
+
+        first_message = None
+        for message in messages:
+            if message.is_user and message.type == "user_message":
+                content = message.content
+                first_message = content if isinstance(content, str) else json.dumps(content)
+                break
+
+        last = messages[-1]
+
+        await self._db.executemany(
+            """
+            INSERT INTO messages (conversation_id, seq, id, type, content_json, is_user, ts)
+            SELECT ?, COALESCE(MAX(seq), 0) + 1, ?, ?, ?, ?, ?
+            FROM messages WHERE conversation_id = ?
+            """,
+            [
+                (
+                    conversation_id,
+                    message.id,
+                    message.type,
+                    content_json,
+                    int(message.is_user),
+                    iso_from_ns(message.ts_ns),
+                    conversation_id,
+                )
+                for message, content_json in zip(messages, encoded_contents)
+            ],
+        )
+        await self._db.execute(
+            """
+            UPDATE conversations SET
+                message_count = message_count + ?,
+                last_activity = ?,
+                last_activity_ns = ?,
+                first_message = COALESCE(first_message, ?)
+            WHERE id = ?
+            """,
+            (len(messages), iso_from_ns(last.ts_ns), last.ts_ns, first_message, conversation_id),
+        )
+        await self._db.commit()
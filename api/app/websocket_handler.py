@@ -1,57 +1,158 @@
-import json
 import asyncio
-import os
-from typing import Dict, Any, Optional
+import logging
+from typing import Dict, Any, AsyncIterator, Awaitable, Callable, List, Optional
+import orjson
 from fastapi import WebSocket
+from pydantic import BaseModel
 from workflow.workflow import Workflow
-import dspy
+
+logger = logging.getLogger(__name__)
+
+
+def _default(obj: Any) -> Any:
+    """Serialize the few types orjson doesn't handle natively"""
+    if isinstance(obj, BaseModel):
+        return obj.model_dump()
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+class MessageBatcher:
+    """Coalesces outbound messages into one "batch" frame per flush window
+
+    Messages are queued already JSON-encoded, so the batch frame is spliced
+    together from bytes without re-encoding anything.
+    """
+
+    def __init__(self, websocket: WebSocket, window: float = 0.01, max_messages: int = 32):
+        self.websocket = websocket
+        self.window = window
+        self.max_messages = max_messages
+        self._buffer: List[bytes] = []
+        self._flush_task: Optional[asyncio.Task] = None
+        self._send_lock = asyncio.Lock()
+
+    async def add(self, payload: bytes):
+        self._buffer.append(payload)
+        if len(self._buffer) >= self.max_messages:
+            await self.flush()
+        elif self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_after(self.window))
+
+    async def flush(self):
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        await self._send()
+
+    async def _flush_after(self, delay: float):
+        await asyncio.sleep(delay)
+        # Detach before sending so an explicit flush can't cancel us mid-send
+        self._flush_task = None
+        await self._send()
+
+    async def _send(self):
+        # The lock keeps timer and explicit flushes from reordering frames
+        async with self._send_lock:
+            if not self._buffer:
+                return
+            payloads, self._buffer = self._buffer, []
+            await self.websocket.send_bytes(b'{"type":"batch","messages":[' + b",".join(payloads) + b"]}")
+
+
+_PIPE_DONE = object()
+
+
+async def _pipe(source: AsyncIterator[Any], sink: Callable[[Any], Awaitable[None]], maxsize: int = 4):
+    """Drain an async iterator into sink, overlapping production with sending"""
+    queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+
+    async def produce():
+        async for item in source:
+            await queue.put(item)
+        await queue.put(_PIPE_DONE)
+
+    async def consume():
+        while (item := await queue.get()) is not _PIPE_DONE:
+            await sink(item)
+
+    try:
+        async with asyncio.TaskGroup() as tg:
+            tg.create_task(produce())
+            tg.create_task(consume())
+    except ExceptionGroup as eg:
+        # Surface the original failure rather than the group wrapper
+        raise eg.exceptions[0]
+
+
+# Heartbeats the client sends as {"type":"ping","timestamp":<epoch ms>}
+_PING_HEAD = '{"type":"ping"'
+_TIMESTAMP_KEY = '"timestamp":'
+
+
+def _frame_prefix(frame_type: str, conversation_id: str) -> bytes:
+    """Invariant head of a frame as JSON bytes, left open for more fields"""
+    return orjson.dumps({"type": frame_type, "conversation_id": conversation_id})[:-1]
+
 
 class AnalysisWebSocketHandler:
-    def __init__(self, websocket: WebSocket, conversation_id: str, connection_manager=None):
+    def __init__(self, websocket: WebSocket, conversation_id: str, connection_manager=None, lm=None, pg_pool=None):
         self.websocket = websocket
         self.conversation_id = conversation_id
         self.connection_manager = connection_manager
+        self.lm = lm  # Shared dspy.LM owned by the app lifespan
+        self.pg_pool = pg_pool  # Shared asyncpg pool owned by the app lifespan
+        self.batcher = MessageBatcher(websocket)
+        self._status_prefix = _frame_prefix("status", conversation_id)
+        self._data_chunk_prefix = _frame_prefix("data_chunk", conversation_id)
+        self._error_prefix = _frame_prefix("error", conversation_id)
+        self._complete_prefix = _frame_prefix("complete", conversation_id)
+        self._pong_prefix = _frame_prefix("pong", conversation_id)
+
+    def rebind(self, websocket: WebSocket):
+        """Point this handler at a reconnected client's socket"""
+        self.websocket = websocket
+        self.batcher.websocket = websocket
+
+    async def handle_raw(self, data: str):
+        """Handle an inbound text frame, answering plain heartbeats without parsing them"""
+        if data.startswith(_PING_HEAD):
+            _, found, tail = data.partition(_TIMESTAMP_KEY)
+            timestamp = tail.rstrip("} ")
+            if found and timestamp.isdigit():
+                await self.websocket.send_bytes(
+                    self._pong_prefix + b',"timestamp":' + timestamp.encode() + b"}"
+                )
+                return
+        await self.handle_message(orjson.loads(data))
 
     async def send_message(self, message: Dict[str, Any]):
-        await self.websocket.send_text(json.dumps(message))
+        await self.websocket.send_bytes(orjson.dumps(message, default=_default))
 
     async def send_status(self, status: str, details: Optional[str] = None):
-        message = {
-            "type": "status",
-            "status": status,
-            "conversation_id": self.conversation_id
-        }
+        frame = self._status_prefix + b',"status":' + orjson.dumps(status)
         if details:
-            message["details"] = details
-        await self.send_message(message)
+            frame += b',"details":' + orjson.dumps(details)
+        await self.websocket.send_bytes(frame + b"}")
 
     async def send_data_chunk(self, chunk: Any, chunk_type: str = "data"):
-        message = {
-            "type": "data_chunk",
-            "chunk_type": chunk_type,
-            "data": chunk,
-            "conversation_id": self.conversation_id
-        }
-        await self.send_message(message)
+        frame = (
+            self._data_chunk_prefix
+            + b',"chunk_type":' + orjson.dumps(chunk_type)
+            + b',"data":' + orjson.dumps(chunk, default=_default)
+        )
+        await self.websocket.send_bytes(frame + b"}")
 
     async def send_error(self, error: str, error_code: Optional[str] = None):
-        message = {
-            "type": "error",
-            "error": error,
-            "conversation_id": self.conversation_id
-        }
+        frame = self._error_prefix + b',"error":' + orjson.dumps(error)
         if error_code:
-            message["error_code"] = error_code
-        await self.send_message(message)
+            frame += b',"error_code":' + orjson.dumps(error_code)
+        await self.websocket.send_bytes(frame + b"}")
 
     async def send_completion(self, summary: Optional[str] = None):
-        message = {
-            "type": "complete",
-            "conversation_id": self.conversation_id
-        }
+        frame = self._complete_prefix
         if summary:
-            message["summary"] = summary
-        await self.send_message(message)
+            frame += b',"summary":' + orjson.dumps(summary)
+        await self.websocket.send_bytes(frame + b"}")
 
     async def process_analyze_request(self, query: str, options: Optional[Dict[str, Any]] = None):
         try:
@@ -61,25 +162,24 @@ class AnalysisWebSocketHandler:
             await self.send_status("processing", "Processing query...")
             await asyncio.sleep(0.2)
 
-            # Replace with real workflow later
-            results = await self.simulate_analysis(query, options or {})
-
             await self.send_status("streaming", "Streaming results...")
 
-            for result_chunk in results:
+            async def send_chunk(result_chunk):
                 await self.send_data_chunk(result_chunk, "analysis_result")
                 await asyncio.sleep(0.1)
 
+            # Replace with real workflow later
+            await _pipe(self.simulate_analysis(query, options or {}), send_chunk)
+
             await self.send_completion("Analysis completed successfully")
 
         except Exception as e:
             await self.send_error(f"Analysis failed: {str(e)}", "ANALYSIS_ERROR")
 
     async def simulate_analysis(self, query: str, options: Dict[str, Any]):
-        results = []
         for i in range(5):
             await asyncio.sleep(0.3)  # simulate processing
-            result = {
+            yield {
                 "chunk_id": i + 1,
                 "query": query,
                 "result": f"Analysis result {i + 1} for: {query}",
@@ -89,69 +189,70 @@ class AnalysisWebSocketHandler:
                     "options": options
                 }
             }
-            results.append(result)
-        return results
 
     async def handle_message(self, message: Dict[str, Any]):
-        print("this is the message", message)
+        # Bind hot attributes once; keepalive pings are the common case
+        cm = self.connection_manager
+        cid = self.conversation_id
         message_type = message.get("type")
 
-        if message_type == "analyze":
+        if message_type == "ping":
+            await self.send_message({
+                "type": "pong",
+                "conversation_id": cid,
+                "timestamp": message.get("timestamp")
+            })
+
+        elif message_type == "analyze":
             query = message.get("query", "")
             options = message.get("options", {})
             
             # Store user message in history
-            if self.connection_manager:
-                self.connection_manager.add_message_to_history(
-                    self.conversation_id, "user_message", query, is_user=True
-                )
+            if cm:
+                await cm.add_message_to_history(cid, "user_message", query, is_user=True)
             
             # Check if we have an existing workflow state
             existing_workflow = None
-            if self.connection_manager:
-                existing_workflow = self.connection_manager.get_workflow_state(self.conversation_id)
+            if cm:
+                existing_workflow = cm.get_workflow_state(cid)
             
             # Create or reuse workflow
             if existing_workflow:
-                print(f"Resuming existing workflow for conversation {self.conversation_id}")
+                logger.debug("Resuming existing workflow for conversation %s", cid)
                 wf = existing_workflow
             else:
-                print(f"Creating new workflow for conversation {self.conversation_id}")
-                lm = dspy.LM('anthropic/claude-sonnet-4-20250514', api_key=os.getenv('ANTHROPIC_API_KEY'))
-                wf = Workflow(conversation_id=self.conversation_id, model=lm)
+                logger.debug("Creating new workflow for conversation %s", cid)
+                wf = Workflow(conversation_id=cid, model=self.lm, pg_pool=self.pg_pool)
                 
                 # Store the new workflow state
-                if self.connection_manager:
-                    self.connection_manager.store_workflow_state(self.conversation_id, wf)
+                if cm:
+                    await cm.store_workflow_state(cid, wf)
             
             # Process the query
-            response_messages = []
-            async for response in wf.run(query):
-                # every response from workflow is a Response object
-                # convert it to dict before sending
+            batcher = self.batcher
+            history_buf = []
+
+            async def forward(response):
+                # every response from workflow is a Response object;
+                # encode it once and reuse the bytes for the socket and history
                 response_dict = response.to_dict()
-                await self.send_message(response_dict)
-                response_messages.append(response_dict)
+                payload = orjson.dumps(response_dict, default=_default)
+                await batcher.add(payload)
+                history_buf.append((response_dict, payload))
+
+            # The workflow keeps computing while earlier responses are being sent
+            await _pipe(wf.run(query), forward)
+            await batcher.flush()
             
-            # Store AI responses in history
-            if self.connection_manager:
-                for resp in response_messages:
-                    self.connection_manager.add_message_to_history(
-                        self.conversation_id, "ai_response", resp, is_user=False
-                    )
+            # Store AI responses in history with a single store write
+            if cm:
+                await cm.add_messages_to_history_bulk(cid, "ai_response", history_buf, is_user=False)
                 
                 # Update workflow state after processing
-                self.connection_manager.store_workflow_state(self.conversation_id, wf)
-                self.connection_manager.update_conversation_status(self.conversation_id, "active")
+                await cm.store_workflow_state(cid, wf)
+                await cm.update_conversation_status(cid, "active")
 
             await self.send_completion("Analysis completed successfully")
 
-        elif message_type == "ping":
-            await self.send_message({
-                "type": "pong",
-                "conversation_id": self.conversation_id,
-                "timestamp": message.get("timestamp")
-            })
-
         else:
             await self.send_error(f"Unknown message type: {message_type}", "INVALID_MESSAGE_TYPE")
@@ -8,5 +8,6 @@ if __name__ == "__main__":
         host="0.0.0.0",
         port=8000,
         reload=True,
+        loop="uvloop",  # Shipped with uvicorn[standard]; fail loudly rather than fall back to asyncio
         log_level="info"
     )
\ No newline at end of file
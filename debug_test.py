@@ -18,42 +18,54 @@ async def debug_rds_connection():
     print(f"User: {user}")
     print(f"Password: {'*' * len(password) if password else 'NOT SET'}")
     
-    # Test different SSL modes
+    # Test different SSL modes concurrently
     ssl_modes = ["require", "prefer", "disable"]
-    
-    for ssl_mode in ssl_modes:
-        print(f"\n--- Testing with SSL mode: {ssl_mode} ---")
+
+    async def try_ssl_mode(ssl_mode):
+        conn = await asyncpg.connect(
+            host=host,
+            port=port,
+            database=database,
+            user=user,
+            password=password,
+            ssl=ssl_mode,
+            command_timeout=30
+        )
         try:
-            conn = await asyncpg.connect(
-                host=host,
-                port=port,
-                database=database,
-                user=user,
-                password=password,
-                ssl=ssl_mode,
-                command_timeout=30
-            )
-            
             # Test a simple query
-            result = await conn.fetchval("SELECT 1")
-            print(f"✓ SUCCESS with SSL={ssl_mode}")
-            print(f"Test query result: {result}")
-            
+            return await conn.fetchval("SELECT 1")
+        finally:
             await conn.close()
+
+    tasks = {asyncio.create_task(try_ssl_mode(ssl_mode)): ssl_mode for ssl_mode in ssl_modes}
+    pending = set(tasks)
+    while pending:
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        stop = False
+        for task in done:
+            ssl_mode = tasks[task]
+            print(f"\n--- Result with SSL mode: {ssl_mode} ---")
+            e = task.exception()
+            if e is None:
+                print(f"✓ SUCCESS with SSL={ssl_mode}")
+                print(f"Test query result: {task.result()}")
+                stop = True
+            elif isinstance(e, asyncpg.InvalidAuthorizationSpecificationError):
+                print(f"✗ Authentication failed: {e}")
+                stop = True  # No point waiting on other SSL modes
+            elif isinstance(e, asyncpg.InvalidCatalogNameError):
+                print(f"✗ Database '{database}' not found: {e}")
+                stop = True  # No point waiting on other SSL modes
+            else:
+                print(f"✗ Failed with SSL={ssl_mode}: {e}")
+                print(f"Error type: {type(e).__name__}")
+
+        if stop:
+            # Stop the remaining handshakes
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
             break
-            
-        except asyncpg.InvalidAuthorizationSpecificationError as e:
-            print(f"✗ Authentication failed: {e}")
-            break  # No point trying other SSL modes
-            
-        except asyncpg.InvalidCatalogNameError as e:
-            print(f"✗ Database '{database}' not found: {e}")
-            break  # No point trying other SSL modes
-            
-        except Exception as e:
-            print(f"✗ Failed with SSL={ssl_mode}: {e}")
-            print(f"Error type: {type(e).__name__}")
-            continue
 
 # Run the test
 asyncio.run(debug_rds_connection())
\ No newline at end of file
@@ -1,7 +1,8 @@
 import os
+import logging
 import asyncpg
 import dspy
-from utils import ContextAndCall
+from utils import ContextAndCall, get_module
 from typing import List, Dict, Any
 from objects import Tool, Response
 from dotenv import load_dotenv
@@ -9,6 +10,8 @@ from pydantic import BaseModel
 from pydantic.fields import Field
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 class BarChartData(BaseModel):
     x_labels: list[str | int | float] = Field(description="Labels for the x-axis")
     y_values: dict[str, list[int | float]] = Field(description="Values for the y-axis which should match the length of the x_labels")
@@ -25,15 +28,15 @@ class BarChartSignature(dspy.Signature):
     context: str = dspy.InputField(
         desc = "Context of the entire DB schema for the business basis of which table queries or charts must be made"
     ) 
+    conversation_history: List[Dict[str, str]] = dspy.InputField(
+        desc="Previous messages between user and assistant: [{'role': 'user'|'assistant', 'content': str}]"
+    )
     user_prompt: str = dspy.InputField(
         desc="User's prompt to which reason this decision is being taken"
     )
     memory: str = dspy.InputField(
         desc="Formatted memory from previous tool executions, including results and descriptions"
     )
-    conversation_history: List[Dict[str, str]] = dspy.InputField(
-        desc="Previous messages between user and assistant: [{'role': 'user'|'assistant', 'content': str}]"
-    )
     previous_errors: str = dspy.InputField(
         desc="Previous failures by agent/tool name to avoid repeating mistakes"
     )
@@ -61,15 +64,15 @@ class LineChartSignature(dspy.Signature):
     context: str = dspy.InputField(
         desc = "Context of the entire DB schema for the business basis of which table queries or charts must be made"
     ) 
+    conversation_history: List[Dict[str, str]] = dspy.InputField(
+        desc="Previous messages between user and assistant: [{'role': 'user'|'assistant', 'content': str}]"
+    )
     user_prompt: str = dspy.InputField(
         desc="User's prompt to which reason this decision is being taken"
     )
     memory: str = dspy.InputField(
         desc="Formatted memory from previous tool executions, including results and descriptions"
     )
-    conversation_history: List[Dict[str, str]] = dspy.InputField(
-        desc="Previous messages between user and assistant: [{'role': 'user'|'assistant', 'content': str}]"
-    )
     previous_errors: str = dspy.InputField(
         desc="Previous failures by agent/tool name to avoid repeating mistakes"
     )
@@ -98,13 +101,21 @@ class ChartTool(Tool):
             }
         )
         self.model = model
+        # One generation module per chart kind, bound to the current tree_data on each call
+        self._modules: Dict[str, ContextAndCall] = {
+            "bar": get_module(BarChartSignature),
+            "line": get_module(LineChartSignature),
+        }
+
+    def _get_module(self, chart_type: str, tree_data) -> ContextAndCall:
+        return self._modules["bar" if chart_type == "bar" else "line"].bind(tree_data)
         
     async def __call__(self, tree_data, inputs, **kwargs):
         try:
             chart_type = inputs["chart_type"]
             guidance = inputs["guidance"]
 
-            chart_generation_module = ContextAndCall(BarChartSignature if chart_type == "bar" else LineChartSignature, tree_data)
+            chart_generation_module = self._get_module(chart_type, tree_data)
             prediction = await chart_generation_module.aforward(
                 guidance=guidance,
                 lm = self.model
@@ -122,7 +133,7 @@ class ChartTool(Tool):
                     metadata=metadata,
                     description=f"{prediction.overall_description}."
                 )
-            print(f"this is the response that i got from the chart generation module {response}")
+            logger.debug("chart generation response %s", response)
             yield response    
 
 
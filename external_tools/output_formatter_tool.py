@@ -1,7 +1,22 @@
 import dspy
+import logging
 from typing import List, Dict, Any
+from cachetools import TTLCache
 from objects import Tool, Response
-from utils import ContextAndCall
+from helper_functions import log_exception_once
+from utils import get_module, inputs_digest
+
+logger = logging.getLogger(__name__)
+
+# Formatted replies keyed by everything the formatter prompt is built from.
+# Entries expire since memory and history move on within a session.
+_output_cache: TTLCache = TTLCache(maxsize=512, ttl=3600)
+
+
+def _cache_key(model, inputs: Dict[str, Any]) -> str:
+    # Guidance that differs only in case or spacing asks for the same reply
+    normalized = dict(inputs, guidance=" ".join(str(inputs.get("guidance", "")).split()).casefold())
+    return inputs_digest(model, normalized)
 
 class OutputFormattingSignature(dspy.Signature):
     """Turn agent state + guidance into a clean, user-facing text reply.
@@ -17,15 +32,15 @@ class OutputFormattingSignature(dspy.Signature):
     context: str = dspy.InputField(
         desc="Full business/domain context or DB schema summary relevant to this turn"
     )
+    conversation_history: List[Dict[str, str]] = dspy.InputField(
+        desc="Previous messages between user and assistant: [{'role': 'user'|'assistant', 'content': str}]"
+    )
     user_prompt: str = dspy.InputField(
         desc="The user's most recent natural-language request"
     )
     memory: str = dspy.InputField(
         desc="Formatted memory from previous tool executions, including results and descriptions"
     )
-    conversation_history: List[Dict[str, str]] = dspy.InputField(
-        desc="Previous messages between user and assistant: [{'role': 'user'|'assistant', 'content': str}]"
-    )
     # available_branches: Dict[str, str] = dspy.InputField(
     #     desc="Available branches to navigate to: {'branch_name': 'what this branch handles'}"
     # )
@@ -73,26 +88,31 @@ class OutputFormatterTool(Tool):
             },
         )
         self.model = model
+        self._module = get_module(OutputFormattingSignature)
 
     async def __call__(self, tree_data, inputs: Dict[str, Any], **kwargs) -> Response:
-        print("DEBUG: Starting OutputFormatterTool...")
-        print(f"DEBUG: Inputs received: {inputs}")
+        logger.debug("OutputFormatterTool inputs: %s", inputs)
         try:
             guidance = inputs["guidance"]
-            print(f" DEBUG: Guidance: {guidance}")
 
-            # Build the DSPy module with full tree_data (which should contain context, memory, etc.)
-            print(" DEBUG: Creating output formatting module...")
-            formatter_module = ContextAndCall(OutputFormattingSignature, tree_data)
+            # Bind the shared module to the full tree_data (which should contain context, memory, etc.)
+            formatter_module = self._module.bind(tree_data)
 
-            print("DEBUG: Calling formatter forward...")
-            prediction = await formatter_module.aforward(
+            module_inputs = formatter_module.build_inputs(
                 available_tools={},
                 available_branches={},
                 guidance=guidance,
                 lm=self.model,
             )
-            print(f"✅ DEBUG: Formatting completed. Prediction: {prediction}")
+            key = _cache_key(self.model, module_inputs)
+            output_text = _output_cache.get(key)
+            if output_text is None:
+                prediction = await formatter_module.aforward_inputs(module_inputs)
+                logger.debug("Formatting completed. Prediction: %s", prediction)
+                output_text = prediction.output_text
+                _output_cache[key] = output_text
+            else:
+                logger.debug("Reusing cached formatter output")
 
             # formatted_text = prediction.formatted_text or ""
             # title = getattr(prediction, "title", "") or "Response"
@@ -109,21 +129,19 @@ class OutputFormatterTool(Tool):
 
             response = Response(
                 type="text",
-                data=[{"text": prediction.output_text}],
+                data=[{"text": output_text}],
                 frontend=True,
                 metadata={},
                 description="",
+                is_clean=True,  # output_text is a str field; nothing else here needs sanitizing
             )
 
             # print(f"✅ DEBUG: Response created with title '{title}', tone '{tone}'.")
             # print("\U0001F4AC DEBUG: About to yield formatted response...")
             yield response
-            print("✅ DEBUG: Formatted response yielded successfully")
 
         except Exception as e:
-            import traceback
-            print(f"❌ DEBUG: Exception occurred in OutputFormatterTool: {type(e).__name__}: {e}")
-            print(f"❌ DEBUG: Traceback: {traceback.format_exc()}")
+            log_exception_once(logger, "OutputFormatterTool failed", e)
 
             # Provide a graceful fallback so the agent can still show something in UI
             fallback_text = (
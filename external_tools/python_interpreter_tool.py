@@ -1,12 +1,25 @@
 # planner_signature.py
+import asyncio
+import atexit
+import copy
 import dspy
+import hashlib
 import json
+import logging
+import orjson
+import re
+from cachetools import TTLCache
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, Any, List, Optional
-from utils import ContextAndCall
+from helper_functions import log_exception_once
+from utils import get_module
 from objects import Tool, Response
 import inspect
 from collections.abc import Awaitable
 from dspy import PythonInterpreter  # requires Deno installed locally
+from dspy.primitives.code_interpreter import CodeExecutionError
+
+logger = logging.getLogger(__name__)
 
 class PythonSnippetSignature(dspy.Signature):
     """
@@ -14,17 +27,18 @@ class PythonSnippetSignature(dspy.Signature):
     Optimize to do in the best way possible without computing with extra variables and output only what's asked and not anything more than that.
     """
     context: str = dspy.InputField(desc="DB/business schema, column names, metric definitions, units, etc.")
-    user_prompt: str = dspy.InputField(desc="User's original request")
-    memory: str = dspy.InputField(desc="Formatted memory with previous tool outputs (tables, aggregates)")
-    conversation_history: List[Dict[str, str]] = dspy.InputField(desc="[{role, content}, ...]")
     available_branches: Dict[str, str] = dspy.InputField(desc="{'branch_name': 'what it handles'}")
     available_tools: Dict[str, Dict[str, Any]] = dspy.InputField(desc="{'tool': {'description': str, 'inputs': dict}}")
+    conversation_history: List[Dict[str, str]] = dspy.InputField(desc="[{role, content}, ...]")
+    user_prompt: str = dspy.InputField(desc="User's original request")
+    memory: str = dspy.InputField(desc="Formatted memory with previous tool outputs (tables, aggregates)")
     previous_errors: str = dspy.InputField(desc="Failures from prior turns to avoid")
     guidance: str = dspy.InputField(desc="What to compute (e.g., 'gross margin % for July 2025')")
 
     python_code: str = dspy.OutputField(desc=(
         "Executable Python snippet. It must read required variables from the injected namespace. "
-        "The *last expression* should evaluate to the final result (scalar/array/dict). "
+        "The *last expression* should evaluate to the final result as a plain dict (or list) keyed by the output variables; "
+        "do not json.dumps it, the value is passed back as-is. "
         "Raise ValueError with a helpful message for invalid inputs."
         "The values being returned and usable by the python snippet here must be same as those in the output variables headers"
     ))
@@ -35,6 +49,100 @@ class PythonSnippetSignature(dspy.Signature):
 # python_interpreter_tool.py
 
 
+# Snippets run in the sandbox's globals, which persist between calls; snapshot
+# the pristine names once and drop everything else before reusing a sandbox
+_SNAPSHOT_GLOBALS = '_baseline_names = set(globals()) | {"_baseline_names", "_name"}'
+_RESET_GLOBALS = """
+for _name in list(globals()):
+    if _name not in _baseline_names:
+        del globals()[_name]
+"""
+
+
+class _WarmInterpreter:
+    """A PythonInterpreter pinned to its own thread; it refuses calls from any other"""
+
+    def __init__(self):
+        self.interp = PythonInterpreter()
+        self.thread = ThreadPoolExecutor(max_workers=1, thread_name_prefix="pyodide")
+
+    async def run(self, code: str, variables: Optional[Dict[str, Any]] = None):
+        return await asyncio.get_running_loop().run_in_executor(self.thread, self.interp, code, variables)
+
+    def close(self):
+        # Queue the (blocking) shutdown on the sandbox's own thread: it stays off the
+        # event loop and only runs once a snippet still in flight there has finished,
+        # e.g. when the task awaiting it was cancelled
+        self.thread.submit(self.interp.shutdown)
+        self.thread.shutdown(wait=False)
+
+
+class _InterpreterPool:
+    """Up to `size` booted sandboxes shared by every PythonInterpreterTool"""
+
+    def __init__(self, size: int = 4):
+        self._slots = asyncio.Semaphore(size)
+        self._idle: List[_WarmInterpreter] = []
+        self._all: set = set()
+
+    async def acquire(self) -> _WarmInterpreter:
+        await self._slots.acquire()
+        if self._idle:
+            return self._idle.pop()
+        warm = _WarmInterpreter()
+        try:
+            await warm.run(_SNAPSHOT_GLOBALS)
+        except BaseException:
+            warm.close()
+            self._slots.release()
+            raise
+        self._all.add(warm)
+        return warm
+
+    async def release(self, warm: _WarmInterpreter, healthy: bool):
+        if healthy:
+            try:
+                await warm.run(_RESET_GLOBALS)
+                self._idle.append(warm)
+                self._slots.release()
+                return
+            except Exception:
+                pass
+        # Don't hand out a sandbox in an unknown state; the next acquire boots a new one
+        self._all.discard(warm)
+        warm.close()
+        self._slots.release()
+
+    def close(self):
+        for warm in self._all:
+            warm.close()
+        self._all.clear()
+        self._idle.clear()
+
+
+_interpreters = _InterpreterPool()
+atexit.register(_interpreters.close)
+
+# Raw sandbox output of snippets that ran successfully, keyed by code + variables.
+# Only snippets that read nothing but their inputs are stored, and entries expire
+# in case one slips past _NONDETERMINISTIC.
+_snippet_results: TTLCache = TTLCache(maxsize=256, ttl=300)
+
+# Snippets touching the clock, randomness or the outside world can give a different
+# result for the same code and inputs
+_NONDETERMINISTIC = re.compile(
+    r"\b(?:datetime|date|time|now|today|utcnow|random|secrets|uuid|os|sys|io|open|input|urllib|requests|pyodide|js)\b"
+)
+
+
+def _snippet_key(code: str, variables: Optional[Dict[str, Any]]) -> Optional[str]:
+    """Cache key for a snippet run, or None if its result can't be reused"""
+    if _NONDETERMINISTIC.search(code):
+        return None
+    payload = json.dumps([code, variables or {}], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
 class PythonInterpreterTool(Tool):
     """
     Plans a Python computation with a DSPy Signature, then executes it inside
@@ -54,16 +162,16 @@ class PythonInterpreterTool(Tool):
         )
         self.model = model
         self.tree_data = tree_data  # whatever you pass to ContextAndCall in your stack
+        self._module = get_module(PythonSnippetSignature)
         # self.planner_signature_cls = planner_signature_cls
     
 
     async def __call__(self, tree_data, inputs: Dict[str, Any], **kwargs):
-        print("🚀 DEBUG: PythonInterpreterTool start")
-        print(f"🔍 DEBUG: Inputs: {inputs}")
+        logger.debug("PythonInterpreterTool inputs: %s", inputs)
         try:
             result = None
             guidance: str = inputs["guidance"]
-            interp_generation_module = ContextAndCall(PythonSnippetSignature, tree_data)
+            interp_generation_module = self._module.bind(tree_data)
             prediction = await interp_generation_module.aforward(
                     available_tools={},  # No tools needed for SQL generation
                     available_branches={},  # No branches needed
@@ -72,46 +180,56 @@ class PythonInterpreterTool(Tool):
                 )
             # print("prediction", prediction)
             metadata = {"description": prediction.purpose}
-            with PythonInterpreter() as interp:
+            snippet_key = _snippet_key(prediction.python_code, prediction.expected_variables)
+            if snippet_key is not None and snippet_key in _snippet_results:
+                # Copy so downstream wrapping never touches the cached value
+                result = copy.deepcopy(_snippet_results[snippet_key])
+            else:
+                warm = await _interpreters.acquire()
+                healthy = False
+                try:
                     # Execute the snippet with injected variables
-                    result = interp(prediction.python_code, variables=prediction.expected_variables)
-                    print("rsult is ", result)
-                    print("type", type(result))
-                    if inspect.isawaitable(result) or isinstance(result, Awaitable):
-                        result = await result
-                    else:
-                        result = result
-                    
-                    if isinstance(result, str):
-                        try:
-                            parsed = json.loads(result)
-                            result = parsed
-                            print("Parsed JSON result into Python object.")
-                        except Exception:
-                            # not JSON — keep string but surface a clear error instead of TypeError
-                            raise ValueError(
-                                "Interpreter returned a string (not dict/list). "
-                                "Either return a Python dict/list from the snippet or return JSON that can be parsed."
-                            )
-
-                    # If result is a list (e.g., list of records) and prediction.output_variables expects multiple keys,
-                    # wrap it under a single name so downstream code can access it.
-                    if isinstance(result, list):
-                        # prefer a canonical key name that matches planner expectations, e.g. 'final_result'
-                        result = {"final_result": result}
-
-                    # Now ensure it's a mapping for the following loop
-                    if not isinstance(result, dict):
-                        raise ValueError(f"Interpreter returned unsupported type {type(result)}; expected dict or list-of-dicts.")
-
-                    for variable in prediction.output_variables:
-                        if variable not in result:
-                            raise KeyError(f"Expected output variable '{variable}' not present in interpreter result keys: {list(result.keys())}")
-                        print(result[variable], f"this is {variable}")
-                    
+                    result = await warm.run(prediction.python_code, prediction.expected_variables)
+                    healthy = True
+                except (CodeExecutionError, SyntaxError):
+                    # The snippet failed, not the sandbox; it can still be reused
+                    healthy = True
+                    raise
+                finally:
+                    await _interpreters.release(warm, healthy)
+                if snippet_key is not None:
+                    _snippet_results[snippet_key] = copy.deepcopy(result)
+            logger.debug("Interpreter result (%s): %s", type(result).__name__, result)
+            if inspect.isawaitable(result) or isinstance(result, Awaitable):
+                result = await result
+            else:
+                result = result
+            
+            if isinstance(result, str):
+                try:
+                    result = orjson.loads(result)
+                except orjson.JSONDecodeError:
+                    # not JSON — keep string but surface a clear error instead of TypeError
+                    raise ValueError(
+                        "Interpreter returned a string (not dict/list). "
+                        "Either return a Python dict/list from the snippet or return JSON that can be parsed."
+                    ) from None
+
+            # If result is a list (e.g., list of records) and prediction.output_variables expects multiple keys,
+            # wrap it under a single name so downstream code can access it.
+            if isinstance(result, list):
+                # prefer a canonical key name that matches planner expectations, e.g. 'final_result'
+                result = {"final_result": result}
+
+            # Now ensure it's a mapping for the following loop
+            if not isinstance(result, dict):
+                raise ValueError(f"Interpreter returned unsupported type {type(result)}; expected dict or list-of-dicts.")
+
+            missing = [variable for variable in prediction.output_variables if variable not in result]
+            if missing:
+                raise KeyError(f"Expected output variables {missing} not present in interpreter result keys: {list(result.keys())}")
+
             if result is not None:
-                for variable in prediction.output_variables:
-                        print(result[variable], f"this is {variable}")
                 response = Response(
                     type="interpreter",
                     data = result,
@@ -122,7 +240,7 @@ class PythonInterpreterTool(Tool):
                 )
                 yield response
         except Exception as e:
-            print("thesee are the exceptions:", e)
+            log_exception_once(logger, "PythonInterpreterTool failed", e)
              
             yield Response(
                 type="text",
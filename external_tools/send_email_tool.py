@@ -16,15 +16,15 @@ class EmailCompositionSignature(dspy.Signature):
     context: str = dspy.InputField(
         desc="Business context and any relevant background information"
     )
+    conversation_history: List[Dict[str, str]] = dspy.InputField(
+        desc="Previous messages between user and assistant"
+    )
     user_prompt: str = dspy.InputField(
         desc="User's request for what email to send"
     )
     memory: str = dspy.InputField(
         desc="Previous conversation context and tool results"
     )
-    conversation_history: List[Dict[str, str]] = dspy.InputField(
-        desc="Previous messages between user and assistant"
-    )
     previous_errors: str = dspy.InputField(
         desc="Previous email sending failures to avoid"
     )
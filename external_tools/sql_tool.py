@@ -1,34 +1,42 @@
+import asyncio
+import json
+import logging
 import os
 import re
+from functools import lru_cache
 from unittest import result
 import asyncpg
 import dspy
-from utils import ContextAndCall
-from typing import List, Dict, Any
+from cachetools import LRUCache
+from helper_functions import log_exception_once
+from utils import get_module, inputs_digest
+from typing import List, Dict, Any, Optional
 from objects import Tool, Response
 from dotenv import load_dotenv
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 class SQLGenerationSignature(dspy.Signature):
     """Generate SQL query and predict result structure based on user guidance"""
     
     context: str = dspy.InputField(
         desc = "Context of the entire DB schema for the business basis of which table queries or charts must be made"
     ) 
-    user_prompt: str = dspy.InputField(
-        desc="User's prompt to which reason this decision is being taken"
+    available_branches: Dict[str, str] = dspy.InputField(
+        desc="Available branches to navigate to: {'branch_name': 'description of what this branch handles'}"
     )
-    memory: str = dspy.InputField(
-        desc="Formatted memory from previous tool executions, including results and descriptions"
+    available_tools: Dict[str, Dict[str, Any]] = dspy.InputField(  # Updated type
+        desc="Available tools with their descriptions and input requirements: {'tool_name': {'description': str, 'inputs': dict}}"
     )
     conversation_history: List[Dict[str, str]] = dspy.InputField(
         desc="Previous messages between user and assistant: [{'role': 'user'|'assistant', 'content': str}]"
     )
-    available_branches: Dict[str, str] = dspy.InputField(
-        desc="Available branches to navigate to: {'branch_name': 'description of what this branch handles'}"
+    user_prompt: str = dspy.InputField(
+        desc="User's prompt to which reason this decision is being taken"
     )
-    available_tools: Dict[str, Dict[str, Any]] = dspy.InputField(  # Updated type
-        desc="Available tools with their descriptions and input requirements: {'tool_name': {'description': str, 'inputs': dict}}"
+    memory: str = dspy.InputField(
+        desc="Formatted memory from previous tool executions, including results and descriptions"
     )
     previous_errors: str = dspy.InputField(
         desc="Previous failures by agent/tool name to avoid repeating mistakes"
@@ -40,8 +48,94 @@ class SQLGenerationSignature(dspy.Signature):
     column_descriptions: Dict[str, str] = dspy.OutputField(desc="Description of what each column represents")
     query_purpose: str = dspy.OutputField(desc="Brief description of what this query accomplishes and why this query is being run in response to guidance provided by the Decision Node")
 
+# Generated SQL plans keyed by everything the generation prompt is built from
+# (schema, memory, user prompt, history, errors) plus the model, so a plan is only
+# reused when the model would have seen exactly the same context
+_sql_plans: LRUCache = LRUCache(maxsize=256)
+
+
+def _plan_key(model, inputs: Dict[str, Any]) -> str:
+    # Guidance that differs only in case or spacing asks for the same query
+    normalized = dict(inputs, guidance=" ".join(str(inputs.get("guidance", "")).split()).casefold())
+    return inputs_digest(model, normalized)
+
+
+async def create_pool():
+    """Create an asyncpg pool from the PG_* environment variables"""
+    return await asyncpg.create_pool(
+        host=os.getenv("PG_HOST"),
+        port=int(os.getenv("PG_PORT", 5432)),
+        database=os.getenv("PG_DB"),
+        user=os.getenv("PG_RO_USER"),
+        password=os.getenv("PG_RO_PW"),
+        ssl="require",
+        min_size=4,
+        max_size=20,
+        command_timeout=30,
+        # Generated queries repeat their shapes; keep prepared statements around
+        statement_cache_size=1024,
+        max_cached_statement_lifetime=300,
+        max_inactive_connection_lifetime=300,
+    )
+
+@lru_cache(maxsize=4)
+def _table_aliases(context: str) -> Dict[str, str]:
+    """Map the ways guidance may name a table (table name, entity name, plurals) to the table"""
+    try:
+        entities = json.loads(context).get("entities", {})
+    except (TypeError, ValueError, AttributeError):
+        return {}
+    aliases = {}
+    for entity, spec in entities.items():
+        table = spec.get("table") if isinstance(spec, dict) else None
+        if not table:
+            continue
+        for name in (table, table.replace("_", " "), re.sub(r"(?<!^)(?=[A-Z])", " ", entity).lower()):
+            aliases[name] = table
+            aliases[name[:-1] + "ies" if name.endswith("y") else name + "es" if name.endswith(("s", "x")) else name + "s"] = table
+    return aliases
+
+
+class FastSQLRouter:
+    """Answers plain row-count guidance with a fixed query instead of asking the LM
+
+    The table is only ever taken from the schema context, never from the
+    guidance text, so the generated SQL can't be steered by it.
+    """
+
+    PATTERNS = [
+        re.compile(r"^(?:count|number) of (?:all )?(?:the )?(?P<table>[a-z_ ]+?)(?: records| rows)?$"),
+        re.compile(r"^count (?:all |the )?(?:number of |total )?(?P<table>[a-z_ ]+?)(?: records| rows)?$"),
+        re.compile(r"^how many (?P<table>[a-z_ ]+?)(?: records| rows)?(?: are there| exist| do we have)?$"),
+        re.compile(r"^total (?:number of )?(?:rows|records) in (?:the )?(?P<table>[a-z_ ]+?)(?: table)?$"),
+        re.compile(r"^(?:get |fetch |show )?(?:the )?row count (?:of|for|in) (?:the )?(?P<table>[a-z_ ]+?)(?: table)?$"),
+    ]
+
+    def match(self, guidance: str, context: str) -> Optional[dspy.Prediction]:
+        text = " ".join(guidance.lower().split()).rstrip(".?!")
+        if len(text) > 80:
+            return None
+        for pattern in self.PATTERNS:
+            found = pattern.match(text)
+            if found is None:
+                continue
+            table = _table_aliases(context or "").get(found.group("table"))
+            if table is None:
+                return None
+            return dspy.Prediction(
+                sql_query=f'SELECT COUNT(*) AS row_count FROM "{table}"',
+                expected_columns=["row_count"],
+                column_descriptions={"row_count": f"Number of rows in {table}"},
+                query_purpose=f"Count the rows in {table}",
+            )
+        return None
+
+
+_router = FastSQLRouter()
+
+
 class SQLTool(Tool):
-    def __init__(self, model):
+    def __init__(self, model, connection_pool=None):
         super().__init__(
             name="run_sql",
             description="Generate and execute SQL queries based on natural language guidance",
@@ -54,118 +148,100 @@ class SQLTool(Tool):
             }
         )
         self.model = model
-        self.connection_pool = None
+        self._module = get_module(SQLGenerationSignature)
+        # Normally the app-wide pool; created lazily when the tool runs standalone
+        self.connection_pool = connection_pool
+        self._pool_lock = asyncio.Lock()
     
     async def _get_connection(self):
         """Initialize connection pool if not exists"""
-        print("🔍 DEBUG: Attempting to create connection pool...")
-        
-        # Debug environment variables
-        host = os.getenv("PG_HOST")
-        port = int(os.getenv("PG_PORT", 5432))
-        database = os.getenv("PG_DB")
-        user = os.getenv("PG_RO_USER")
-        password = os.getenv("PG_RO_PW")
-        
-        print(f"🔍 DEBUG: Connection params - Host: {host}, Port: {port}, DB: {database}, User: {user}")
-        print(f"🔍 DEBUG: Password set: {'Yes' if password else 'No'}")
-        
-        if self.connection_pool is None:
+        if self.connection_pool is not None:
+            return self.connection_pool
+        async with self._pool_lock:
+            # Concurrent first calls wait here instead of each creating a pool
+            if self.connection_pool is not None:
+                return self.connection_pool
+            logger.debug(
+                "Creating connection pool - Host: %s, Port: %s, DB: %s, User: %s, Password set: %s",
+                os.getenv('PG_HOST'), os.getenv('PG_PORT', 5432), os.getenv('PG_DB'),
+                os.getenv('PG_RO_USER'), 'Yes' if os.getenv('PG_RO_PW') else 'No',
+            )
             try:
-                self.connection_pool = await asyncpg.create_pool(
-                    host=host,
-                    port=port,
-                    database=database,
-                    user=user,
-                    password=password,
-                    ssl="require",
-                    max_size=20,
-                    command_timeout=30
-                )
-                print("✅ DEBUG: Connection pool created successfully")
-            except Exception as e:
-                print(f"❌ DEBUG: Failed to create connection pool: {e}")
+                self.connection_pool = await create_pool()
+            except Exception:
+                logger.exception("Failed to create connection pool")
                 raise
         return self.connection_pool
     
     
     async def __call__(self, tree_data, inputs: Dict[str, Any], **kwargs) -> Response:
-        print("🚀 DEBUG: Starting SQL tool execution...")
-        print(f"🔍 DEBUG: Inputs received: {inputs}")
+        logger.debug("SQLTool inputs: %s", inputs)
         
+        plan_key = None
         try:
             guidance = inputs["guidance"]
-            print(f"🔍 DEBUG: Guidance: {guidance}")
-            
-            # Use ContextAndCall for SQL generation with full context
-            print("🔍 DEBUG: Creating SQL generation module...")
-            sql_generation_module = ContextAndCall(SQLGenerationSignature, tree_data)
-            
-            print("🔍 DEBUG: Calling SQL generation forward...")
-            prediction = await sql_generation_module.aforward(
-                available_tools={},  # No tools needed for SQL generation
-                available_branches={},  # No branches needed
-                guidance=guidance,
-                lm=self.model
-            )
-            print(f"✅ DEBUG: SQL generation completed. Prediction: {prediction}")
+
+            prediction = _router.match(guidance, tree_data.context)
+            if prediction is not None:
+                logger.debug("Guidance answered by FastSQLRouter")
+            else:
+                # Bind the shared SQL generation module to the full context
+                sql_generation_module = self._module.bind(tree_data)
+                module_inputs = sql_generation_module.build_inputs(
+                    available_tools={},  # No tools needed for SQL generation
+                    available_branches={},  # No branches needed
+                    guidance=guidance,
+                    lm=self.model
+                )
+                plan_key = _plan_key(self.model, module_inputs)
+                prediction = _sql_plans.get(plan_key)
+                if prediction is not None:
+                    logger.debug("Reusing cached SQL plan")
+                else:
+                    prediction = await sql_generation_module.aforward_inputs(module_inputs)
+                    logger.debug("SQL generation completed. Prediction: %s", prediction)
+                    _sql_plans[plan_key] = prediction
             
             sql_query = prediction.sql_query
-            print(f"🔍 DEBUG: Generated SQL query: {sql_query}")
+            logger.debug("Executing SQL query: %s", sql_query)
             
             # Execute query
-            print("🔍 DEBUG: Getting database connection...")
             pool = await self._get_connection()
-            print("✅ DEBUG: Got connection pool")
-            
-            print("🔍 DEBUG: Acquiring connection from pool...")
             async with pool.acquire() as connection:
-                print("✅ DEBUG: Connection acquired, executing query...")
-                
-                # Test connection first
-                try:
-                    test_result = await connection.fetch("SELECT 1 as test")
-                    print(f"✅ DEBUG: Connection test successful: {test_result}")
-                except Exception as test_e:
-                    print(f"❌ DEBUG: Connection test failed: {test_e}")
-                    raise
-                
-                print(f"🔍 DEBUG: Executing main query: {sql_query}")
                 rows = await connection.fetch(sql_query)
-                print(f"✅ DEBUG: Query executed successfully. Row count: {len(rows)}")
-                
-                result_data = [dict(row) for row in rows]
-                print(f"🔍 DEBUG: Converted to dict format. Sample: {result_data[:2] if result_data else 'No data'}")
-                
-                actual_columns = list(result_data[0].keys()) if result_data else prediction.expected_columns
-                print(f"🔍 DEBUG: Actual columns: {actual_columns}")
-                
-                metadata = {
-                    "query": sql_query,
-                    "headers": actual_columns,
-                    "column_descriptions": prediction.column_descriptions,
-                    "row_count": len(result_data),
-                    "query_purpose": prediction.query_purpose,
-                }
-                
-                response = Response(
-                    type="table",
-                    data=result_data,
-                    frontend=True,
-                    metadata=metadata,
-                    description=f"{prediction.query_purpose}."
-                )
-                print(f"✅ DEBUG: Response created: {response}")
-                print(f"🔍 DEBUG: Response data sample: {response.data[:2] if response.data else 'No data'}")
-
-                print("🔍 DEBUG: About to yield response...")
-                yield response
-                print("✅ DEBUG: Response yielded successfully")
-                
+            logger.debug("Query returned %d rows", len(rows))
+            # The connection goes back to the pool before results are handed on
+            # Every record shares the same columns; read them once instead of per row
+            keys = list(rows[0].keys()) if rows else []
+            result_data = [dict(zip(keys, row.values())) for row in rows]
+            
+            actual_columns = keys if rows else prediction.expected_columns
+            logger.debug("Result columns: %s", actual_columns)
+            
+            metadata = {
+                "query": sql_query,
+                "headers": actual_columns,
+                "column_descriptions": prediction.column_descriptions,
+                "row_count": len(result_data),
+                "query_purpose": prediction.query_purpose,
+            }
+            
+            response = Response(
+                type="table",
+                data=result_data,
+                frontend=True,
+                metadata=metadata,
+                description=f"{prediction.query_purpose}."
+            )
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Response data sample: %s", result_data[:2] if result_data else 'No data')
+            yield response
+            
         except Exception as e:
-            print(f"❌ DEBUG: Exception occurred: {type(e).__name__}: {str(e)}")
-            import traceback
-            print(f"❌ DEBUG: Full traceback: {traceback.format_exc()}")
+            # A plan that failed must be regenerated (with the error in context) next time
+            if plan_key is not None:
+                _sql_plans.pop(plan_key, None)
+            log_exception_once(logger, "SQLTool failed", e)
             
             yield Response(
                 type="text",
@@ -1,7 +1,9 @@
 import os.path
+import asyncio
 import base64
+import threading
 from email.mime.text import MIMEText
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, Tuple
 
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
@@ -12,12 +14,50 @@ from googleapiclient.errors import HttpError
 # NOTE: changed scope so we can create drafts
 SCOPES = ["https://www.googleapis.com/auth/gmail.compose"]
 
+# Gmail's batch endpoint accepts at most this many calls per HTTP request
+BATCH_LIMIT = 100
+
+_ASCII_HEADERS = b'Content-Type: text/plain; charset="us-ascii"\nMIME-Version: 1.0\nContent-Transfer-Encoding: 7bit\n'
+
+
+def _build_raw(to: str, subject: str, body: str) -> str:
+    """base64url-encoded RFC 5322 message for a plain-text draft
+
+    Plain ASCII messages are written directly, byte-for-byte what MIMEText
+    produces; anything needing encoding or header folding goes through MIMEText.
+    """
+    if (
+        to.isascii() and subject.isascii() and body.isascii()
+        and "\r" not in to + subject and "\n" not in to + subject
+        and "\r" not in body  # MIMEText normalises CRLF/CR line endings to LF
+        and len(to) <= 70 and len(subject) <= 68
+    ):
+        raw = b"".join((
+            _ASCII_HEADERS,
+            b"to: ", to.encode("ascii"),
+            b"\nfrom: me\nsubject: ", subject.encode("ascii"),
+            b"\n\n", body.encode("ascii"),
+        ))
+    else:
+        msg = MIMEText(body)
+        msg["to"] = to
+        msg["from"] = "me"
+        msg["subject"] = subject
+        raw = msg.as_bytes()
+    return base64.urlsafe_b64encode(raw).decode()
+
+
 class GmailService:
     def __init__(self, credentials_file: str = "credentials.json", token_file: str = "token.json"):
         self.credentials_file = credentials_file
         self.token_file = token_file
         self.service = None
         self.credentials = None
+        self._drafts_resource = None
+        self._drafts_service = None
+        # The client's httplib2 transport is not thread-safe; every .execute() on self.service
+        # (status checks included) must hold this, since they run in worker threads
+        self._http_lock = threading.Lock()
         
     def authenticate(self) -> bool:
         """Authenticate with Gmail API and return True if successful"""
@@ -43,7 +83,8 @@ class GmailService:
                     token.write(creds.to_json())
             
             self.credentials = creds
-            self.service = build("gmail", "v1", credentials=creds)
+            self.service = None
+            self.ensure_service()
             print("✓ Gmail service connection established")
             return True
             
@@ -51,6 +92,24 @@ class GmailService:
             print(f"✗ Gmail authentication failed: {str(e)}")
             return False
     
+    def ensure_service(self):
+        """Build the Gmail client once from the discovery document bundled with googleapiclient"""
+        if self.service is None and self.credentials:
+            self.service = build(
+                "gmail", "v1",
+                credentials=self.credentials,
+                cache_discovery=False,
+                static_discovery=True
+            )
+        return self.service
+
+    def _drafts(self):
+        """users().drafts() resource, built once per service instance"""
+        if self._drafts_service is not self.service:
+            self._drafts_resource = self.service.users().drafts()
+            self._drafts_service = self.service
+        return self._drafts_resource
+
     def check_connection(self) -> Dict[str, Any]:
         """Check Gmail connection status and return detailed info"""
         status = {
@@ -75,7 +134,8 @@ class GmailService:
             status["service_available"] = True
             
             # Test connection by getting user profile
-            profile = self.service.users().getProfile(userId='me').execute()
+            with self._http_lock:
+                profile = self.service.users().getProfile(userId='me').execute()
             status["connected"] = True
             status["user_email"] = profile.get('emailAddress')
             
@@ -104,14 +164,9 @@ class GmailService:
             return None
         
         try:
-            msg = MIMEText(body)
-            msg["to"] = to
-            msg["from"] = "me"
-            msg["subject"] = subject
-            
-            raw = base64.urlsafe_b64encode(msg.as_bytes()).decode()
-            draft_body = {"message": {"raw": raw}}
-            draft = self.service.users().drafts().create(userId="me", body=draft_body).execute()
+            draft_body = {"message": {"raw": _build_raw(to, subject, body)}}
+            with self._http_lock:
+                draft = self._drafts().create(userId="me", body=draft_body).execute()
             
             print(f"✓ Draft created successfully - ID: {draft.get('id')}")
             return draft
@@ -120,6 +175,46 @@ class GmailService:
             print(f"✗ Failed to create draft: {str(e)}")
             return None
 
+    async def create_draft_async(self, to: str, subject: str, body: str) -> Optional[Dict[str, Any]]:
+        """create_draft without blocking the event loop"""
+        return await asyncio.to_thread(self.create_draft, to, subject, body)
+
+    def create_drafts(self, messages: List[Tuple[str, str, str]]) -> List[Optional[Dict[str, Any]]]:
+        """Create several drafts from (to, subject, body) tuples, up to BATCH_LIMIT per HTTP call
+
+        Results line up with messages; a draft that failed is None.
+        """
+        if not self.service:
+            print("✗ Gmail service not available")
+            return [None] * len(messages)
+
+        results: List[Optional[Dict[str, Any]]] = [None] * len(messages)
+
+        def collect(request_id, response, exception):
+            if exception is not None:
+                print(f"✗ Failed to create draft: {str(exception)}")
+            else:
+                results[int(request_id)] = response
+
+        drafts = self._drafts()
+        for start in range(0, len(messages), BATCH_LIMIT):
+            batch = self.service.new_batch_http_request(callback=collect)
+            for index, (to, subject, body) in enumerate(messages[start:start + BATCH_LIMIT], start):
+                draft_body = {"message": {"raw": _build_raw(to, subject, body)}}
+                batch.add(drafts.create(userId="me", body=draft_body), request_id=str(index))
+            try:
+                with self._http_lock:
+                    batch.execute()
+            except Exception as e:
+                print(f"✗ Failed to create drafts: {str(e)}")
+
+        print(f"✓ Created {sum(r is not None for r in results)}/{len(messages)} drafts")
+        return results
+
+    async def create_drafts_async(self, messages: List[Tuple[str, str, str]]) -> List[Optional[Dict[str, Any]]]:
+        """create_drafts without blocking the event loop"""
+        return await asyncio.to_thread(self.create_drafts, messages)
+
 def main():
     gmail = GmailService()
     
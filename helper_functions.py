@@ -1,14 +1,259 @@
+import base64
 import json
+from collections import OrderedDict
+from dataclasses import asdict
 from datetime import datetime, date, time
 from decimal import Decimal
 from uuid import UUID
-from typing import Any, Dict, List, Union
+from typing import Any, Callable, Dict, List, Tuple, Union
 import logging
 
+import orjson
+
 logger = logging.getLogger(__name__)
+
+# Errors whose traceback was already logged, most recently seen last
+_seen_tracebacks: "OrderedDict[tuple, None]" = OrderedDict()
+_SEEN_TRACEBACKS_MAX = 256
+
+
+def log_exception_once(log: logging.Logger, message: str, exc: BaseException) -> None:
+    """
+    Log an exception with its traceback the first time it is seen.
+
+    Repeats of the same error (same message, type and text) are logged as a
+    single line; formatting a traceback reads source for every frame, which
+    adds up when one failure repeats across many requests.
+    """
+    key = (message, type(exc).__name__, str(exc)[:128])
+    if key in _seen_tracebacks:
+        _seen_tracebacks.move_to_end(key)
+        log.error("%s: %s: %s (repeated, traceback omitted)", message, type(exc).__name__, exc)
+        return
+    _seen_tracebacks[key] = None
+    if len(_seen_tracebacks) > _SEEN_TRACEBACKS_MAX:
+        _seen_tracebacks.popitem(last=False)
+    log.error(message, exc_info=exc)
+
+
+def _identity(obj: Any) -> Any:
+    return obj
+
+
+def _isoformat(obj: Any) -> str:
+    return obj.isoformat()
+
+
+_b64encode = base64.b64encode
+
+
+def _b64(obj: bytes) -> str:
+    return _b64encode(obj).decode('utf-8')
+
+
+# Container handlers return (output container, child items) and _sanitize fills the
+# container in; a (value, None) return is a finished leaf, e.g. a placeholder string
+def _expand_list(obj: Any) -> Tuple[Any, Any]:
+    return [], obj
+
+
+def _expand_dict(obj: Dict[Any, Any]) -> Tuple[Any, Any]:
+    return {}, obj.items()
+
+
+def _expand_object(obj: Any) -> Tuple[Any, Any]:
+    try:
+        return {}, obj.__dict__.items()
+    except:
+        logger.warning(f"Could not serialize object of type {type(obj)}")
+        return f"<{type(obj).__name__} object>", None
+
+
+def _expand_dataclass(obj: Any) -> Tuple[Any, Any]:
+    try:
+        return {}, asdict(obj).items()
+    except:
+        logger.warning(f"Could not serialize dataclass {type(obj)}")
+        return f"<{type(obj).__name__} dataclass>", None
+
+
+def _stringify(obj: Any) -> Any:
+    try:
+        return str(obj)
+    except:
+        logger.warning(f"Removing non-serializable object of type {type(obj)}")
+        return None
+
+
+# Handler per exact type; types not listed are resolved once by _resolve_handler and added
+_HANDLERS: Dict[type, Callable[[Any], Any]] = {
+    type(None): _identity,
+    str: _identity,
+    int: _identity,
+    float: _identity,
+    bool: _identity,
+    UUID: str,
+    datetime: datetime.isoformat,
+    date: date.isoformat,
+    time: time.isoformat,
+    Decimal: str,
+    bytes: _b64,
+    set: _expand_list,
+    list: _expand_list,
+    tuple: _expand_list,
+    dict: _expand_dict,
+}
+
+
+def _resolve_handler(obj: Any) -> Callable[[Any], Any]:
+    """Pick the handler for a type missing from _HANDLERS (subclasses, custom classes)"""
+    if isinstance(obj, (str, int, float, bool)):
+        return _identity
+    if isinstance(obj, UUID):
+        return str
+    if isinstance(obj, (datetime, date, time)):
+        return _isoformat
+    if isinstance(obj, Decimal):
+        return str
+    if isinstance(obj, bytes):
+        return _b64
+    if isinstance(obj, (set, list, tuple)):
+        return _expand_list
+    if isinstance(obj, dict):
+        return _expand_dict
+    # Objects with __dict__ (custom classes), then slotted dataclasses
+    if hasattr(obj, '__dict__'):
+        return _expand_object
+    if hasattr(obj, '__dataclass_fields__'):
+        return _expand_dataclass
+    # Fallback: try to convert to string, or remove if that fails
+    return _stringify
+
+
+_EXPANDERS = frozenset({_expand_list, _expand_dict, _expand_object, _expand_dataclass})
+
+
+def _handler(obj: Any) -> Callable[[Any], Any]:
+    handler = _HANDLERS.get(type(obj))
+    if handler is None:
+        handler = _HANDLERS[type(obj)] = _resolve_handler(obj)
+    return handler
+
+
+_CIRCULAR = "<circular reference>"
+
+
+def _sanitize(obj: Any) -> Any:
+    """Sanitize without recursion: containers are filled from an explicit work stack
+
+    The ids of the containers on the current path are kept in a set: a frame
+    adds its container's id when it is processed, and an exit marker pushed
+    under the frame drops it again once everything nested in it is done. A
+    value that contains itself is cut off instead of expanded forever.
+    """
+    # Locals for the per-node lookups
+    handlers, expanders, handler_for, scalars = _HANDLERS, _EXPANDERS, _handler, _JSON_SCALARS
+    root: List[Any] = []
+    stack = [(root, (obj,), None)]
+    push, pop = stack.append, stack.pop
+    on_path = set()
+    enter, leave = on_path.add, on_path.discard
+    while stack:
+        out, items, ident = pop()
+        if out is None:
+            # Exit marker: the container with this id is finished
+            leave(ident)
+            continue
+        if ident is not None:
+            enter(ident)
+        if type(out) is list:
+            append = out.append
+            for item in items:
+                kind = type(item)
+                if kind in scalars:
+                    append(item)
+                    continue
+                handler = handlers.get(kind) or handler_for(item)
+                if handler in expanders:
+                    ident = id(item)
+                    if ident in on_path:
+                        logger.warning(f"Replacing circular reference to {kind}")
+                        append(_CIRCULAR)
+                        continue
+                    value, children = handler(item)
+                    if children is not None:
+                        push((None, None, ident))
+                        push((value, children, ident))
+                else:
+                    try:
+                        value = handler(item)
+                    except Exception as e:
+                        logger.warning(f"Skipping list item due to serialization error: {e}")
+                        continue
+                append(value)
+        else:
+            for key, value in items:
+                # Convert non-string keys to strings
+                if not isinstance(key, str):
+                    try:
+                        key = str(key)
+                    except:
+                        logger.warning(f"Skipping non-convertible key: {key}")
+                        continue
+
+                kind = type(value)
+                if kind in scalars:
+                    out[key] = value
+                    continue
+                handler = handlers.get(kind) or handler_for(value)
+                if handler in expanders:
+                    ident = id(value)
+                    if ident in on_path:
+                        logger.warning(f"Skipping key '{key}' due to circular reference")
+                        continue
+                    value, children = handler(value)
+                    if children is not None:
+                        push((None, None, ident))
+                        push((value, children, ident))
+                else:
+                    try:
+                        value = handler(value)
+                    except Exception as e:
+                        logger.warning(f"Skipping key '{key}' due to serialization error: {e}")
+                        continue
+                out[key] = value
+    return root[0]
+
+
+_JSON_SCALARS = frozenset({str, int, float, bool, type(None)})
+
+
+def _is_core(obj: Any) -> bool:
+    """True if obj holds only plain JSON types (exact types, str keys), i.e. sanitizing would only copy it"""
+    stack = [obj]
+    seen = set()  # Containers met so far; a repeat may be a cycle, which _sanitize has to cut
+    while stack:
+        value = stack.pop()
+        kind = type(value)
+        if kind is list or kind is dict:
+            if id(value) in seen:
+                return False
+            seen.add(id(value))
+            if kind is list:
+                stack.extend(value)
+                continue
+            for key in value:
+                if type(key) is not str:
+                    return False
+            stack.extend(value.values())
+        elif kind not in _JSON_SCALARS:
+            return False
+    return True
+
+
 def sanitize_for_json(obj: Any) -> Any:
     """
-    Recursively sanitize an object (or list of objects) for JSON serialization.
+    Sanitize an object (or list of objects), including everything nested in it, for JSON serialization.
     
     Converts common non-JSON types to strings:
     - UUID -> string
@@ -17,91 +262,26 @@ def sanitize_for_json(obj: Any) -> Any:
     - bytes -> base64 string
     - sets -> lists
     
-    Removes keys with unsupported types that can't be converted.
+    Removes keys and list items with unsupported types that can't be converted.
+    A container nested inside itself is cut off: as a dict value its key is
+    skipped, as a list item it becomes "<circular reference>".
     
     Args:
         obj: Object, list, dict, or primitive to sanitize
         
     Returns:
-        JSON-serializable version of the object
+        JSON-serializable version of the object; obj itself when it is
+        already made only of plain JSON types
     """
-    
-    # Handle None and primitives (str, int, float, bool)
-    if obj is None or isinstance(obj, (str, int, float, bool)):
+    if type(obj) in _JSON_SCALARS:
         return obj
-    
-    # Handle UUID
-    if isinstance(obj, UUID):
-        return str(obj)
-    
-    # Handle datetime objects
-    if isinstance(obj, datetime):
-        return obj.isoformat()
-    if isinstance(obj, date):
-        return obj.isoformat()
-    if isinstance(obj, time):
-        return obj.isoformat()
-    
-    # Handle Decimal
-    if isinstance(obj, Decimal):
-        return str(obj)
-    
-    # Handle bytes
-    if isinstance(obj, bytes):
-        import base64
-        return base64.b64encode(obj).decode('utf-8')
-    
-    # Handle sets
-    if isinstance(obj, set):
-        return [sanitize_for_json(item) for item in obj]
-    
-    # Handle lists and tuples
-    if isinstance(obj, (list, tuple)):
-        return [sanitize_for_json(item) for item in obj]
-    
-    # Handle dictionaries
-    if isinstance(obj, dict):
-        sanitized = {}
-        for key, value in obj.items():
-            # Convert non-string keys to strings
-            if not isinstance(key, str):
-                try:
-                    key = str(key)
-                except:
-                    logger.warning(f"Skipping non-convertible key: {key}")
-                    continue
-            
-            try:
-                sanitized[key] = sanitize_for_json(value)
-            except Exception as e:
-                logger.warning(f"Skipping key '{key}' due to serialization error: {e}")
-                continue
-        
-        return sanitized
-    
-    # Handle objects with __dict__ (custom classes)
-    if hasattr(obj, '__dict__'):
-        try:
-            return sanitize_for_json(obj.__dict__)
-        except:
-            logger.warning(f"Could not serialize object of type {type(obj)}")
-            return f"<{type(obj).__name__} object>"
-    
-    # Handle dataclasses
-    if hasattr(obj, '__dataclass_fields__'):
-        from dataclasses import asdict
-        try:
-            return sanitize_for_json(asdict(obj))
-        except:
-            logger.warning(f"Could not serialize dataclass {type(obj)}")
-            return f"<{type(obj).__name__} dataclass>"
-    
-    # Fallback: try to convert to string, or remove if that fails
-    try:
-        return str(obj)
-    except:
-        logger.warning(f"Removing non-serializable object of type {type(obj)}")
-        return None
+    # Checked once at the top only, so a miss costs one extra scan rather than one per level
+    if _is_core(obj):
+        return obj
+    return _sanitize(obj)
+
+
+_ORJSON_EQUIVALENT = {'ensure_ascii': False, 'indent': 2, 'separators': (',', ': ')}
 
 
 def to_json_string(obj: Any, **kwargs) -> str:
@@ -124,5 +304,13 @@ def to_json_string(obj: Any, **kwargs) -> str:
         'separators': (',', ': ')
     }
     json_kwargs.update(kwargs)
+
+    # orjson renders the default layout itself (NaN/Infinity become null rather than
+    # json's non-standard tokens); ints beyond 64 bits still need json
+    if json_kwargs == _ORJSON_EQUIVALENT:
+        try:
+            return orjson.dumps(sanitized, option=orjson.OPT_INDENT_2).decode()
+        except orjson.JSONEncodeError:
+            pass
     
     return json.dumps(sanitized, **json_kwargs)
@@ -5,14 +5,24 @@ import inspect
 from helper_functions import to_json_string, sanitize_for_json
 
 class Response:
-    def __init__(self, data, type=None, frontend=None, metadata=None, description=None):
+    def __init__(self, data, type=None, frontend=None, metadata=None, description=None, is_clean=False):
         self.type = type or None
         self.data = data
         self.frontend = frontend or None
         self.metadata = metadata or {}
         self.description = description
+        # Set by producers that know data and metadata hold only plain JSON types
+        self._is_clean = is_clean
 
     def to_dict(self):
+        if self._is_clean:
+            return {
+                "type": self.type,
+                "data": self.data,
+                "frontend": self.frontend,
+                "metadata": self.metadata,
+                "description": self.description,
+            }
         return sanitize_for_json({
             "type": self.type,
             "data": self.data,
@@ -42,40 +52,78 @@ class Tool(ABC):
     
     def _format_result(self, raw_result: Any) -> Response:
         """Convert any result into Response format"""
-        if isinstance(raw_result, Response):
-            return raw_result
-        elif isinstance(raw_result, str):
-            return Response(
-                type="text",
-                data=[{"text": raw_result}],
-                frontend=True,
-                metadata={},
-                description=self.description
-            )
-        elif isinstance(raw_result, dict):
-            return Response(
-                type="data_message",
-                data=[raw_result],
-                frontend=True,
-                metadata={},
-                description=self.description
-            )
-        elif isinstance(raw_result, list):
-            return Response(
-                type="table",
-                data=raw_result,
-                frontend=True,
-                metadata={},
-                description=self.description
-            )
-        else:
-            return Response(
-                type="data_message",
-                data=[{"result": str(raw_result)}],
-                frontend=True,
-                metadata={},
-                description=self.description
-            )
+        builder = _RESULT_BUILDERS.get(type(raw_result))
+        if builder is None:
+            builder = _RESULT_BUILDERS[type(raw_result)] = _resolve_result_builder(raw_result)
+        return builder(self, raw_result)
+
+
+def _passthrough_result(tool: Tool, raw_result: Response) -> Response:
+    return raw_result
+
+
+def _text_result(tool: Tool, raw_result: str) -> Response:
+    return Response(
+        type="text",
+        data=[{"text": raw_result}],
+        frontend=True,
+        metadata={},
+        description=tool.description,
+        is_clean=True
+    )
+
+
+def _data_message_result(tool: Tool, raw_result: dict) -> Response:
+    return Response(
+        type="data_message",
+        data=[raw_result],
+        frontend=True,
+        metadata={},
+        description=tool.description
+    )
+
+
+def _table_result(tool: Tool, raw_result: list) -> Response:
+    return Response(
+        type="table",
+        data=raw_result,
+        frontend=True,
+        metadata={},
+        description=tool.description
+    )
+
+
+def _stringified_result(tool: Tool, raw_result: Any) -> Response:
+    return Response(
+        type="data_message",
+        data=[{"result": str(raw_result)}],
+        frontend=True,
+        metadata={},
+        description=tool.description,
+        is_clean=True
+    )
+
+
+# Response builder per exact result type; other types are resolved once by _resolve_result_builder and added
+_RESULT_BUILDERS: Dict[type, Callable[[Tool, Any], Response]] = {
+    Response: _passthrough_result,
+    str: _text_result,
+    dict: _data_message_result,
+    list: _table_result,
+}
+
+
+def _resolve_result_builder(raw_result: Any) -> Callable[[Tool, Any], Response]:
+    """Pick the builder for a result type missing from _RESULT_BUILDERS (subclasses, other types)"""
+    if isinstance(raw_result, Response):
+        return _passthrough_result
+    if isinstance(raw_result, str):
+        return _text_result
+    if isinstance(raw_result, dict):
+        return _data_message_result
+    if isinstance(raw_result, list):
+        return _table_result
+    return _stringified_result
 
 def tool(function: Callable = None, *, name: str = None, description: str = None):
     """Decorator to convert functions into Tools"""
@@ -96,18 +144,21 @@ def tool(function: Callable = None, *, name: str = None, description: str = None
                     "default": param.default if param.default != inspect.Parameter.empty else None
                 }
         
+        is_coroutine = inspect.iscoroutinefunction(func)
+
         class FunctionTool(Tool):
             def __init__(self):
                 super().__init__(tool_name, tool_description, tool_inputs)
                 self._original_function = func
+                self._is_coroutine = is_coroutine
             
             async def __call__(self, tree_data, inputs: Dict[str, Any], **kwargs) -> Response:
                 try:
                     # Call the original function with inputs
-                    if inspect.iscoroutinefunction(func):
-                        result = await func(**inputs)
+                    if self._is_coroutine:
+                        result = await self._original_function(**inputs)
                     else:
-                        result = func(**inputs)
+                        result = self._original_function(**inputs)
                     
                     # Format result into Response
                     return self._format_result(result)
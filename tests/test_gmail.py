@@ -0,0 +1,37 @@
+import base64
+import unittest
+from email.mime.text import MIMEText
+
+from gmail import _build_raw
+
+
+def _mimetext_raw(to: str, subject: str, body: str) -> str:
+    msg = MIMEText(body)
+    msg["to"] = to
+    msg["from"] = "me"
+    msg["subject"] = subject
+    return base64.urlsafe_b64encode(msg.as_bytes()).decode()
+
+
+class BuildRawTest(unittest.TestCase):
+    def assert_matches_mimetext(self, to: str, subject: str, body: str):
+        self.assertEqual(_build_raw(to, subject, body), _mimetext_raw(to, subject, body))
+
+    def test_ascii_body(self):
+        self.assert_matches_mimetext("a@example.com", "Report", "Hello,\n\nFrom the team\n")
+
+    def test_crlf_body(self):
+        self.assert_matches_mimetext("a@example.com", "Report", "Hello,\r\n\r\nSee attached.\r\n")
+
+    def test_bare_cr_body(self):
+        self.assert_matches_mimetext("a@example.com", "Report", "one\rtwo")
+
+    def test_non_ascii_body(self):
+        self.assert_matches_mimetext("a@example.com", "Report", "Total: 5 €")
+
+    def test_long_subject(self):
+        self.assert_matches_mimetext("a@example.com", "Quarterly " * 10, "body")
+
+
+if __name__ == "__main__":
+    unittest.main()
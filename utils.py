@@ -1,59 +1,115 @@
 from dspy.primitives.module import Module
 from workflow.helper_objects import Memory
-import copy
+import asyncio
 import dspy
+import hashlib
 import json
-from typing import Dict, Any
+import weakref
+from typing import Dict, Any, Tuple
+
+# Predictions still being computed, keyed by signature + inputs digest, so
+# identical concurrent calls share one LM request instead of each sending it
+_inflight: Dict[str, asyncio.Future] = {}
+
+
+# Formatted (memory, failures) per TreeData, tagged with the version they were built
+# from; the decision node and the tool it dispatches see the same state
+_prompt_segments: "weakref.WeakKeyDictionary[Any, Tuple[int, str, str]]" = weakref.WeakKeyDictionary()
+
+class SignatureCachedChatAdapter(dspy.ChatAdapter):
+    """ChatAdapter that builds each signature's system message once
+
+    The system message (field descriptions, output structure, task
+    instructions) depends only on the signature class, yet the stock adapter
+    rebuilds it on every call; it is most of the prompt formatting time.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._system_messages: "weakref.WeakKeyDictionary[type, str]" = weakref.WeakKeyDictionary()
+
+    def format_system_message(self, signature) -> str:
+        message = self._system_messages.get(signature)
+        if message is None:
+            message = self._system_messages[signature] = super().format_system_message(signature)
+        return message
+
+
+_adapter = SignatureCachedChatAdapter()
+
+
+# One ContextAndCall per signature class, shared by every tool and conversation
+_modules: Dict[type, "ContextAndCall"] = {}
+
+
+def get_module(signature) -> "ContextAndCall":
+    """The shared ContextAndCall for a signature, built on first use"""
+    module = _modules.get(signature)
+    if module is None:
+        module = _modules[signature] = ContextAndCall(signature)
+    return module
+
+
+def inputs_digest(model, inputs: Dict[str, Any]) -> str:
+    """Stable digest of signature inputs (minus the lm object) and the model they go to"""
+    keyed = {k: v for k, v in inputs.items() if k != "lm"}
+    keyed["model"] = getattr(model, "model", None)
+    payload = json.dumps(keyed, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
 
 class ContextAndCall(Module):
-    def __init__(self, signature, tree_data):
+    """Predictor for one signature; bind(tree_data) gives a view that injects a tree's context"""
+
+    def __init__(self, signature):
         super().__init__()
-        self.tree_data = copy.copy(tree_data)
+        self.tree_data = None
         self.predict = dspy.Predict(signature)
+
+    def bind(self, tree_data) -> "ContextAndCall":
+        """A view sharing this module's predictor, reading context from tree_data"""
+        view = object.__new__(type(self))
+        view.__dict__.update(self.__dict__)
+        view.tree_data = tree_data  # Only read, never mutated, so no copy is needed
+        return view
     
     def format_memory(self, memory: Memory):
-        if not memory.memory:
-            return "No previous actions taken."
-        
-        memory_formatted = ""
-        for item in memory.memory:
-            memory_formatted += f"{item['ordering_number']}: {item['agent_name']}\n"
-            memory_formatted += f"Description: {item['description']}\n"
-            memory_formatted += f"Result: {str(item['data_from_agent_call'])}...\n\n"
-        return memory_formatted
+        return memory.formatted()
     
     def format_failures(self) -> str:
         if not self.tree_data.failures:
             return "No previous failures recorded."
         
-        failures_formatted = ""
-        for failure in self.tree_data.failures:
-            error = failure['error']
-            timestamp = failure['timestamp'].strftime("%Y-%m-%d %H:%M:%S")
-            failures_formatted += f"Failed Agent: {error.agent_name}\n"
-            failures_formatted += f"Error: {error.error_message}\n"
-            failures_formatted += f"Timestamp: {timestamp}\n\n"
-        return failures_formatted
+        return "".join([
+            f"Failed Agent: {failure['error'].agent_name}\n"
+            f"Error: {failure['error'].error}\n"
+            f"Timestamp: {failure['ts_str']}\n\n"
+            for failure in self.tree_data.failures
+        ])
     
-    async def aforward(self, 
-                      available_tools: Dict[str, Any] = None, 
-                      available_branches: Dict[str, str] = None, 
-                      guidance = None,
-                      chart_type = None,
-                      **kwargs):
-        """Call with auto-injected context. Tools and branches are optional."""
-        
-        # Set defaults for optional parameters
-        
-        
-        kwargs.update({
-            "context": self.tree_data.context,
-            "user_prompt": getattr(self.tree_data, 'user_prompt', ''),
-            "memory": self.format_memory(self.tree_data.memory),
-            "conversation_history": self.tree_data.conversation_history,
-            "previous_errors": self.format_failures(),
-            
-        })
+    def prompt_segments(self) -> Tuple[str, str]:
+        """Formatted memory and failures, reused while the tree data hasn't changed"""
+        version = getattr(self.tree_data, "version", None)
+        cached = _prompt_segments.get(self.tree_data) if version is not None else None
+        if cached is not None and cached[0] == version:
+            return cached[1], cached[2]
+        memory, failures = self.format_memory(self.tree_data.memory), self.format_failures()
+        if version is not None:
+            _prompt_segments[self.tree_data] = (version, memory, failures)
+        return memory, failures
+
+    def build_inputs(self,
+                     available_tools: Dict[str, Any] = None,
+                     available_branches: Dict[str, str] = None,
+                     guidance = None,
+                     chart_type = None,
+                     **kwargs) -> Dict[str, Any]:
+        """Signature inputs with the tree context injected. Tools and branches are optional."""
+        # kwargs is already a fresh dict; fill it in place rather than merging a temporary one
+        tree_data = self.tree_data
+        kwargs["memory"], kwargs["previous_errors"] = self.prompt_segments()
+        kwargs["context"] = tree_data.context
+        kwargs["user_prompt"] = getattr(tree_data, 'user_prompt', '')
+        kwargs["conversation_history"] = tree_data.conversation_history
 
         if available_tools is not None:
             kwargs["available_tools"] = available_tools
@@ -67,5 +123,24 @@ class ContextAndCall(Module):
             kwargs["chart_type"] = chart_type
         # with open('kwargs.json', 'w') as f:
         #     json.dump(kwargs, f)
-        
-        return await self.predict.acall(**kwargs)
\ No newline at end of file
+        return kwargs
+
+    async def _call(self, inputs: Dict[str, Any]):
+        # An adapter configured by the application still takes precedence
+        with dspy.context(adapter=dspy.settings.adapter or _adapter):
+            return await self.predict.acall(**inputs)
+
+    async def aforward(self, **kwargs):
+        """Call with auto-injected context. Tools and branches are optional."""
+        return await self.aforward_inputs(self.build_inputs(**kwargs))
+
+    async def aforward_inputs(self, inputs: Dict[str, Any]):
+        """Call with inputs already built by build_inputs, e.g. after keying a cache on them"""
+        key = f"{self.predict.signature.__name__}:{inputs_digest(inputs.get('lm'), inputs)}"
+        call = _inflight.get(key)
+        if call is None:
+            call = asyncio.ensure_future(self._call(inputs))
+            _inflight[key] = call
+            call.add_done_callback(lambda _: _inflight.pop(key, None))
+        # A cancelled caller must not cancel the call for the others waiting on it
+        return await asyncio.shield(call)
\ No newline at end of file
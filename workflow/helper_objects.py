@@ -1,59 +1,117 @@
 import json
+from collections import deque
+from functools import lru_cache
 from typing import Any, Dict, List 
 from helper_functions import to_json_string
 from objects import Response, Error
 from datetime import date, datetime
 
 class Memory:
+    # Entries are stored column-wise, one list per field, rather than as one dict per entry
     def __init__(self, memory: List[Dict[str, Any]] = None):
         if memory is None: 
             memory = []
-        self.memory = memory
+        self.ordering_numbers: List[int] = [item["ordering_number"] for item in memory]
+        self.agent_names: List[str] = [item["agent_name"] for item in memory]
+        self.data: List[Any] = [item["data_from_agent_call"] for item in memory]
+        self.descriptions: List[str] = [item["description"] for item in memory]
+        self.response_types: List[str] = [item.get("response_type") for item in memory]
         self.ordering_number = 1
+        # Prompt text of each entry, appended as entries arrive so formatting never re-walks memory
+        self._formatted_parts: List[str] = [
+            self._format_item(*entry)
+            for entry in zip(self.ordering_numbers, self.agent_names, self.descriptions, self.data)
+        ]
+
+    @staticmethod
+    def _format_item(ordering_number: int, agent_name: str, description: str, data: Any) -> str:
+        return (
+            f"{ordering_number}: {agent_name}\n"
+            f"Description: {description}\n"
+            f"Result: {data}...\n\n"
+        )
+
+    @property
+    def memory(self) -> List[Dict[str, Any]]:
+        """Entries as records, built on demand"""
+        return [
+            {
+                "ordering_number": ordering_number,
+                "agent_name": agent_name,
+                "data_from_agent_call": data,
+                "description": description,
+                "response_type": response_type,
+            }
+            for ordering_number, agent_name, data, description, response_type in zip(
+                self.ordering_numbers, self.agent_names, self.data, self.descriptions, self.response_types
+            )
+        ]
 
     def add_to_memory(self, agent_name: str, response: Response):
-        to_add_object = {
-            "ordering_number" : self.ordering_number,
-            "agent_name" : agent_name,
-            "data_from_agent_call" : response.data,
-            "description" : response.description,
-            "response_type": response.type,
-
-        }
-        self.memory.append(to_add_object)
+        self.ordering_numbers.append(self.ordering_number)
+        self.agent_names.append(agent_name)
+        self.data.append(response.data)
+        self.descriptions.append(response.description)
+        self.response_types.append(response.type)
+        self._formatted_parts.append(
+            self._format_item(self.ordering_number, agent_name, response.description, response.data)
+        )
         self.ordering_number = self.ordering_number + 1
 
+    def formatted(self) -> str:
+        """Memory as prompt text"""
+        return "".join(self._formatted_parts) or "No previous actions taken."
+
     def to_json(self, object_to_sanitize: Dict):
         return to_json_string(object_to_sanitize)
 
              
 
+FAILURE_WINDOW = 5  # Most recent failures kept on a tree
+
+
+@lru_cache(maxsize=1)
+def _load_context() -> str:
+    """Schema context as the JSON string every prompt gets; it never changes while running"""
+    with open('/Users/apple/Desktop/builds/ai-data-search-py/preprocessing/context.json', mode='r') as f:
+        return json.dumps(json.load(f))
+
+
 class TreeData:
     def __init__(self, user_prompt = "", max_count: int = 5):
         self.user_prompt = user_prompt
         self.memory = Memory()
         self.conversation_history = [] #in the form of {role: user, content: message} internally
-        self.failures = []
+        self.failures = deque(maxlen=FAILURE_WINDOW)  # Only recent failures are useful prompt context
         self.step_count = 0
         self.max_count = max_count
-        self.context = None
-        with open('/Users/apple/Desktop/builds/ai-data-search-py/preprocessing/context.json', mode='r') as f:
-            self.context = json.dumps(json.load(f))
+        self.version = 0  # Bumped whenever prompt-visible state (prompt, memory, history, failures) changes
+        self.context = _load_context()
         # self.task_ledger = []
         # self.progress_ledger = []
     
     def update_user_prompt(self, user_prompt: str):
         self.user_prompt = user_prompt
+        self.version += 1
 
     def update_memory(self, agent_name: str, response: Response):
         self.memory.add_to_memory(agent_name, response)
+        self.version += 1
 
     def update_conversation_history(self, role: str, content: str):
         self.conversation_history.append({"role": role, "content": content})
+        self.version += 1
 
     def update_failures(self, agent_name: str, failure: str):
         error = Error(agent_name, failure)
-        self.failures.append({"error": error, "timestamp": datetime.now()})
+        timestamp = datetime.now()
+        self.failures.append({
+            "error": error,
+            "timestamp": timestamp,
+            # Formatted once for every later prompt; same text as strftime("%Y-%m-%d %H:%M:%S")
+            "ts_str": timestamp.isoformat(sep=" ", timespec="seconds"),
+        })
+        self.version += 1
 
     def update_step_count(self):
         self.step_count = self.step_count + 1      
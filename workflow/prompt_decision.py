@@ -25,20 +25,20 @@ class DecisionPrompt(dspy.Signature):
     context: str = dspy.InputField(
         desc = "Context of the entire DB schema for the business basis of which table queries or charts must be made"
     ) 
-    user_prompt: str = dspy.InputField(
-        desc="User's prompt to which reason this decision is being taken"
+    available_branches: Dict[str, str] = dspy.InputField(
+        desc="Available branches to navigate to: {'branch_name': 'description of what this branch handles'}"
     )
-    memory: str = dspy.InputField(
-        desc="Formatted memory from previous tool executions, including results and descriptions"
+    available_tools: Dict[str, Dict[str, Any]] = dspy.InputField(  # Updated type
+        desc="Available tools with their descriptions and input requirements: {'tool_name': {'description': str, 'inputs': dict}}"
     )
     conversation_history: List[Dict[str, str]] = dspy.InputField(
         desc="Previous messages between user and assistant: [{'role': 'user'|'assistant', 'content': str}]"
     )
-    available_branches: Dict[str, str] = dspy.InputField(
-        desc="Available branches to navigate to: {'branch_name': 'description of what this branch handles'}"
+    user_prompt: str = dspy.InputField(
+        desc="User's prompt to which reason this decision is being taken"
     )
-    available_tools: Dict[str, Dict[str, Any]] = dspy.InputField(  # Updated type
-        desc="Available tools with their descriptions and input requirements: {'tool_name': {'description': str, 'inputs': dict}}"
+    memory: str = dspy.InputField(
+        desc="Formatted memory from previous tool executions, including results and descriptions"
     )
     previous_errors: str = dspy.InputField(
         desc="Previous failures by agent/tool name to avoid repeating mistakes"
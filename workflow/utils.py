@@ -1,7 +1,7 @@
 from .prompt_decision import DecisionPrompt
 from typing import Any, Dict
 import dspy
-from utils import ContextAndCall
+from utils import get_module
 
 class DecisionNode:
     def __init__(self, branch_id: str, instruction: str, model):
@@ -10,6 +10,10 @@ class DecisionNode:
         self.available_tools = {}
         self.available_branches = {}
         self.model = model
+        self._module = get_module(DecisionPrompt)
+        # Prompt-ready views of the options, rebuilt only after an option is added
+        self._tools_formatted = None
+        self._branches_formatted = None
 
     def add_tool_option(self, tool_name: str, tool_instance, description: str):
         """Add a Tool instance with its input schema"""
@@ -20,6 +24,7 @@ class DecisionNode:
             "description": description,
             "inputs": tool_instance.inputs  # Store the input schema
         }
+        self._tools_formatted = None
 
     def add_branch_option(self, branch_name: str, description: str):
         if branch_name in self.available_branches:
@@ -27,23 +32,28 @@ class DecisionNode:
         self.available_branches[branch_name] = {
             "description": description
         }
+        self._branches_formatted = None
 
     def get_available_tools_formatted(self) -> Dict[str, Any]:
         """Format tools with descriptions and input schemas for DSPy"""
-        formatted = {}
-        for name, info in self.available_tools.items():
-            formatted[name] = {
-                "description": info["description"],
-                "inputs": info["inputs"]  # Include input requirements
-            }
-        return formatted
+        if self._tools_formatted is None:
+            formatted = {}
+            for name, info in self.available_tools.items():
+                formatted[name] = {
+                    "description": info["description"],
+                    "inputs": info["inputs"]  # Include input requirements
+                }
+            self._tools_formatted = formatted
+        return self._tools_formatted
 
     def get_available_branches_formatted(self) -> Dict[str, str]:
         """Format branches for DSPy"""
-        return {name: info["description"] for name, info in self.available_branches.items()}
+        if self._branches_formatted is None:
+            self._branches_formatted = {name: info["description"] for name, info in self.available_branches.items()}
+        return self._branches_formatted
 
     async def __call__(self, tree_data):
-        decision_module = ContextAndCall(DecisionPrompt, tree_data)
+        decision_module = self._module.bind(tree_data)
         output = await decision_module.aforward(
             available_tools=self.get_available_tools_formatted(),
             available_branches=self.get_available_branches_formatted(),
@@ -1,16 +1,20 @@
 import uuid
+import logging
 import os
 from typing import Dict, Union, Callable, Any
 from .helper_objects import TreeData  
 from .utils import DecisionNode  
-from objects import Tool, tool  
+from objects import Tool, Response, tool  
 from external_tools import sql_tool, charting_tool, python_interpreter_tool, output_formatter_tool
 import asyncio
 import dspy
 
 
+logger = logging.getLogger(__name__)
+
+
 class Workflow:
-    def __init__(self, user_id=None, conversation_id=None, model=None):
+    def __init__(self, user_id=None, conversation_id=None, model=None, pg_pool=None):
         self.user_id = str(uuid.uuid4()) if user_id is None else user_id
         self.conversation_id = str(uuid.uuid4()) if conversation_id is None else conversation_id
         
@@ -20,7 +24,7 @@ class Workflow:
         self.tools_registry = {}  
         self.current_branch = "base"
         self.model = model
-        sql_tool_instance = sql_tool.SQLTool(self.model)
+        sql_tool_instance = sql_tool.SQLTool(self.model, connection_pool=pg_pool)
         chart_tool_instance = charting_tool.ChartTool(self.model)
         python_interpreter_instance = python_interpreter_tool.PythonInterpreterTool(self.model)
         output_formatter_instance = output_formatter_tool.OutputFormatterTool(self.model)
@@ -88,7 +92,7 @@ class Workflow:
             "description": tool_instance.description
         }
         
-        print(f"Added tool '{tool_instance.name}' to branch '{branch_id}'")
+        logger.debug("Added tool '%s' to branch '%s'", tool_instance.name, branch_id)
 
 
     def add_branch(self, 
@@ -132,7 +136,7 @@ class Workflow:
         
         self.decision_nodes[parent_branch].add_branch_option(branch_id, description)
         
-        print(f"Added branch '{branch_id}' under parent '{parent_branch}'")
+        logger.debug("Added branch '%s' under parent '%s'", branch_id, parent_branch)
 
     def remove_branch(self, branch_id: str):
         """Remove a branch (except base)"""
@@ -165,7 +169,7 @@ class Workflow:
         del self.branches[branch_id]
         del self.decision_nodes[branch_id]
         
-        print(f"Removed branch '{branch_id}' and all its tools")    
+        logger.debug("Removed branch '%s' and all its tools", branch_id)    
 
     async def run(self, user_prompt):
         """
@@ -192,7 +196,7 @@ class Workflow:
 
             elif decision.to_choose == "tool":
                 tool = self.decision_nodes[branch_to_use].available_tools[decision.fn_name]["tool"]
-                print("tool decided", tool)
+                logger.debug("tool decided %s", tool)
                 result_or_gen = tool(
                     self.tree_data,
                     inputs=decision.function_inputs,
@@ -201,9 +205,19 @@ class Workflow:
 
                 # 🔑 Case 1: tool is async generator (streams multiple responses)
                 if hasattr(result_or_gen, "__aiter__"):
+                    steps = []
                     async for step in result_or_gen:
                         yield step
-                        self.tree_data.update_memory(decision.fn_name, step)
+                        steps.append(step)
+                    # One memory entry per invocation, however many chunks it streamed
+                    if len(steps) == 1:
+                        self.tree_data.update_memory(decision.fn_name, steps[0])
+                    elif steps:
+                        self.tree_data.update_memory(decision.fn_name, Response(
+                            type=steps[-1].type,
+                            data=[step.data for step in steps],
+                            description="\n".join(step.description for step in steps if step.description),
+                        ))
 
                 # 🔑 Case 2: tool is normal coroutine (returns once)
                 else: